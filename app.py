@@ -1,10 +1,28 @@
 import streamlit as st
+import plotly
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
 import numpy as np
 import random
+import json
+import os
+import threading
+import sqlite3
+import bisect
+import heapq
+import pickle
+import sys
+import time
 from datetime import datetime
+from contextlib import closing
+from decimal import Decimal
+from functools import cached_property
+from fractions import Fraction
+from pathlib import Path
+from streamlit.runtime import Runtime
+from streamlit.runtime.app_session import AppSessionState
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # ===========================
 # CONFIGURACIÓN DE LA PÁGINA
@@ -21,44 +39,442 @@ st.set_page_config(
 # ===========================
 
 @st.cache_data
-def obtener_frutas():
-    """Retorna un diccionario con valores típicos de °Brix por fruta"""
+def obtener_aditivos():
+    """Retorna un diccionario con los °Brix típicos de los aditivos para ajustar la pulpa"""
     return {
-        "Personalizado": {"brix_inicial": 7.0, "descripcion": "Ingresa tus propios valores"},
-        "Manzana": {"brix_inicial": 12.0, "descripcion": "Típico para manzanas frescas"},
-        "Naranja": {"brix_inicial": 11.5, "descripcion": "Jugo de naranja natural"},
-        "Piña": {"brix_inicial": 13.0, "descripcion": "Pulpa de piña fresca"},
-        "Mango": {"brix_inicial": 14.0, "descripcion": "Pulpa de mango maduro"},
-        "Fresa": {"brix_inicial": 8.0, "descripcion": "Pulpa de fresa fresca"},
-        "Durazno": {"brix_inicial": 10.5, "descripcion": "Pulpa de durazno maduro"},
-        "Uva": {"brix_inicial": 16.0, "descripcion": "Jugo de uva natural"},
-        "Maracuyá": {"brix_inicial": 14.5, "descripcion": "Pulpa de maracuyá"},
-        "Guayaba": {"brix_inicial": 8.5, "descripcion": "Pulpa de guayaba rosa"}
+        "Azúcar (sacarosa)": {"brix": 100.0, "descripcion": "Azúcar pura, sin aporte de agua"},
+        "Jarabe de sacarosa": {"brix": 65.0, "descripcion": "Jarabe líquido preparado en planta"},
+        "Jarabe de glucosa": {"brix": 80.0, "descripcion": "Jarabe comercial de alta concentración"},
+        "Azúcar invertido": {"brix": 72.0, "descripcion": "Jarabe de azúcar invertido comercial"},
+        "Concentrado de fruta": {"brix": 65.0, "descripcion": "Concentrado de la misma fruta"},
+        "Personalizado": {"brix": 50.0, "descripcion": "Ingresa los °Brix del aditivo"}
     }
 
-@st.cache_data
+# Catálogo integrado, usado cuando no existe el archivo de catálogo externo
+FRUTAS_INTEGRADAS = {
+    "Personalizado": {"brix_inicial": 7.0, "descripcion": "Ingresa tus propios valores"},
+    "Manzana": {"brix_inicial": 12.0, "descripcion": "Típico para manzanas frescas"},
+    "Naranja": {"brix_inicial": 11.5, "descripcion": "Jugo de naranja natural"},
+    "Piña": {"brix_inicial": 13.0, "descripcion": "Pulpa de piña fresca"},
+    "Mango": {"brix_inicial": 14.0, "descripcion": "Pulpa de mango maduro"},
+    "Fresa": {"brix_inicial": 8.0, "descripcion": "Pulpa de fresa fresca"},
+    "Durazno": {"brix_inicial": 10.5, "descripcion": "Pulpa de durazno maduro"},
+    "Uva": {"brix_inicial": 16.0, "descripcion": "Jugo de uva natural"},
+    "Maracuyá": {"brix_inicial": 14.5, "descripcion": "Pulpa de maracuyá"},
+    "Guayaba": {"brix_inicial": 8.5, "descripcion": "Pulpa de guayaba rosa"}
+}
+
+CASOS_INTEGRADOS = pd.DataFrame({
+    "Producto": ["Mermelada de fresa", "Néctar de durazno", "Concentrado de manzana",
+                 "Jalea de uva", "Salsa de tomate", "Jugo de naranja",
+                 "Almíbar ligero", "Almíbar pesado"],
+    "Fruta": ["Fresa", "Durazno", "Manzana", "Uva", "Tomate", "Naranja", "Mixto", "Mixto"],
+    "°Brix Inicial": [8.0, 10.5, 12.0, 16.0, 5.0, 11.5, 8.0, 8.0],
+    "°Brix Objetivo": [65.0, 14.0, 70.0, 62.0, 28.0, 12.0, 20.0, 40.0],
+    "Aplicación": ["Conserva", "Bebida", "Ingrediente industrial",
+                  "Conserva", "Condimento", "Bebida", "Conservas", "Conservas"],
+    "Notas": [
+        "Requiere cocción prolongada para gelificación",
+        "Producto listo para consumo, mínimo procesamiento",
+        "Se usa como edulcorante natural en industria de panificación",
+        "Alta concentración para estabilidad sin refrigeración",
+        "Balance entre dulzor y acidez para perfil de sabor",
+        "Ajuste ligero para estandarización del producto",
+        "Para frutas en conserva (duraznos, peras)",
+        "Para frutas en conserva de alta calidad"
+    ]
+}).to_dict("records")
+
+COLUMNAS_CASOS = ["Producto", "Fruta", "°Brix Inicial", "°Brix Objetivo", "Aplicación", "Notas"]
+
+# Catálogo externo (JSON con las claves "frutas" y "casos"); se revisa su fecha de
+# modificación en cada ejecución y solo se reindexan las entradas que cambiaron
+RUTA_CATALOGO = os.environ.get("BALANCE_CATALOGO", str(Path(__file__).with_name("catalogo.json")))
+
+@st.cache_resource
+def obtener_registro_catalogo():
+    """Retorna el catálogo compartido por todas las sesiones, inicializado con los datos integrados"""
+    registro = {
+        "lock": threading.Lock(),
+        "firma": None,
+        "version": 0,
+        "origen": "integrado",
+        "error": None,
+        "descartados": [],
+        "frutas": {},
+        "casos": {},
+        "indice_fruta": {},
+        "indice_aplicacion": {},
+        "df_casos": None
+    }
+    aplicar_catalogo(registro, FRUTAS_INTEGRADAS, CASOS_INTEGRADOS)
+    return registro
+
+def actualizar_indice(indice, clave, producto, agregar):
+    """Agrega o quita un producto del índice sin modificar el conjunto que otras sesiones leen"""
+    productos = set(indice.get(clave, ()))
+    if agregar:
+        productos.add(producto)
+    else:
+        productos.discard(producto)
+
+    indice = dict(indice)
+    if productos:
+        indice[clave] = frozenset(productos)
+    else:
+        indice.pop(clave, None)
+    return indice
+
+def aplicar_catalogo(registro, frutas, casos):
+    """
+    Aplica un catálogo nuevo sobre el registro modificando solo las entradas agregadas,
+    cambiadas o eliminadas. Las estructuras se reemplazan (copia al escribir) para que
+    las sesiones que las están leyendo no vean cambios a mitad de una ejecución.
+    Retorna el número de entradas que cambiaron.
+    """
+    cambios = 0
+
+    frutas_actuales = dict(registro["frutas"])
+    for nombre in set(frutas_actuales) - set(frutas):
+        del frutas_actuales[nombre]
+        cambios += 1
+    for nombre, info in frutas.items():
+        if frutas_actuales.get(nombre) != info:
+            frutas_actuales[nombre] = info
+            cambios += 1
+
+    casos_actuales = dict(registro["casos"])
+    indice_fruta = registro["indice_fruta"]
+    indice_aplicacion = registro["indice_aplicacion"]
+    casos_nuevos = {caso["Producto"]: caso for caso in casos}
+    cambios_casos = 0
+
+    for producto, caso in list(casos_actuales.items()):
+        if casos_nuevos.get(producto) != caso:
+            indice_fruta = actualizar_indice(indice_fruta, caso["Fruta"], producto, agregar=False)
+            indice_aplicacion = actualizar_indice(indice_aplicacion, caso["Aplicación"], producto, agregar=False)
+            del casos_actuales[producto]
+            cambios_casos += 1
+    for producto, caso in casos_nuevos.items():
+        if producto not in casos_actuales:
+            indice_fruta = actualizar_indice(indice_fruta, caso["Fruta"], producto, agregar=True)
+            indice_aplicacion = actualizar_indice(indice_aplicacion, caso["Aplicación"], producto, agregar=True)
+            casos_actuales[producto] = caso
+            cambios_casos += 1
+
+    registro["frutas"] = frutas_actuales
+    registro["casos"] = casos_actuales
+    registro["indice_fruta"] = indice_fruta
+    registro["indice_aplicacion"] = indice_aplicacion
+    if cambios_casos:
+        registro["df_casos"] = None
+
+    cambios += cambios_casos
+    if cambios:
+        registro["version"] += 1
+    return cambios
+
+def validar_fruta(nombre, info):
+    """Retorna un mensaje si la fruta no tiene un °Brix inicial utilizable, o None"""
+    if not 0 <= info["brix_inicial"] < 100:
+        return f"Fruta '{nombre}': el °Brix inicial debe estar entre 0 y 100"
+    return None
+
+def validar_caso(caso):
+    """Retorna un mensaje si el caso no se puede resolver agregando azúcar, o None"""
+    if not 0 <= caso["°Brix Inicial"] < caso["°Brix Objetivo"] < 100:
+        return f"Caso '{caso['Producto']}': se requiere 0 ≤ °Brix inicial < °Brix objetivo < 100"
+    return None
+
+def leer_catalogo(ruta):
+    """
+    Lee y valida el archivo de catálogo. Las entradas inválidas se descartan y se
+    describen en `descartados`. Retorna (frutas, casos, descartados, error).
+    """
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+        frutas = {
+            str(nombre): {"brix_inicial": float(info["brix_inicial"]), "descripcion": str(info.get("descripcion", ""))}
+            for nombre, info in datos.get("frutas", FRUTAS_INTEGRADAS).items()
+        }
+        casos = [
+            {columna: (float(caso[columna]) if columna.startswith("°Brix") else str(caso.get(columna, "")))
+             for columna in COLUMNAS_CASOS}
+            for caso in datos.get("casos", CASOS_INTEGRADOS)
+        ]
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as error:
+        return None, None, [], f"No se pudo leer el catálogo {ruta}: {error}"
+
+    descartados = [mensaje for nombre, info in frutas.items() if (mensaje := validar_fruta(nombre, info))]
+    descartados += [mensaje for caso in casos if (mensaje := validar_caso(caso))]
+    frutas = {nombre: info for nombre, info in frutas.items() if validar_fruta(nombre, info) is None}
+    casos = [caso for caso in casos if validar_caso(caso) is None]
+
+    # Los casos se indexan por producto: se conserva la primera entrada de cada uno
+    productos = set()
+    unicos = []
+    for caso in casos:
+        if caso["Producto"] in productos:
+            descartados.append(f"Caso '{caso['Producto']}': producto duplicado, se conserva la primera entrada")
+        else:
+            productos.add(caso["Producto"])
+            unicos.append(caso)
+    casos = unicos
+
+    if "Personalizado" not in frutas:
+        frutas = {"Personalizado": FRUTAS_INTEGRADAS["Personalizado"], **frutas}
+    return frutas, casos, descartados, None
+
+def sincronizar_catalogo(ruta=RUTA_CATALOGO):
+    """
+    Revisa si el archivo de catálogo cambió (tamaño y fecha de modificación) y, si es
+    así, aplica los cambios al registro compartido. Si el archivo no existe se usa el
+    catálogo integrado; si es inválido se conserva la última versión válida.
+    """
+    registro = obtener_registro_catalogo()
+    try:
+        estado = os.stat(ruta)
+        firma = (estado.st_mtime_ns, estado.st_size)
+    except OSError:
+        firma = None
+
+    if firma == registro["firma"]:
+        return registro
+
+    with registro["lock"]:
+        if firma != registro["firma"]:
+            if firma is None:
+                frutas, casos, descartados, error = FRUTAS_INTEGRADAS, CASOS_INTEGRADOS, [], None
+            else:
+                frutas, casos, descartados, error = leer_catalogo(ruta)
+
+            registro["error"] = error
+            if error is None:
+                registro["descartados"] = descartados
+                aplicar_catalogo(registro, frutas, casos)
+                registro["origen"] = "integrado" if firma is None else ruta
+            registro["firma"] = firma
+
+    return registro
+
+def obtener_frutas():
+    """Retorna un diccionario con valores típicos de °Brix por fruta"""
+    return sincronizar_catalogo()["frutas"]
+
 def obtener_casos_estudio():
     """Retorna casos de estudio reales de la industria"""
-    return pd.DataFrame({
-        "Producto": ["Mermelada de fresa", "Néctar de durazno", "Concentrado de manzana",
-                     "Jalea de uva", "Salsa de tomate", "Jugo de naranja",
-                     "Almíbar ligero", "Almíbar pesado"],
-        "Fruta": ["Fresa", "Durazno", "Manzana", "Uva", "Tomate", "Naranja", "Mixto", "Mixto"],
-        "°Brix Inicial": [8.0, 10.5, 12.0, 16.0, 5.0, 11.5, 8.0, 8.0],
-        "°Brix Objetivo": [65.0, 14.0, 70.0, 62.0, 28.0, 12.0, 20.0, 40.0],
-        "Aplicación": ["Conserva", "Bebida", "Ingrediente industrial",
-                      "Conserva", "Condimento", "Bebida", "Conservas", "Conservas"],
-        "Notas": [
-            "Requiere cocción prolongada para gelificación",
-            "Producto listo para consumo, mínimo procesamiento",
-            "Se usa como edulcorante natural en industria de panificación",
-            "Alta concentración para estabilidad sin refrigeración",
-            "Balance entre dulzor y acidez para perfil de sabor",
-            "Ajuste ligero para estandarización del producto",
-            "Para frutas en conserva (duraznos, peras)",
-            "Para frutas en conserva de alta calidad"
-        ]
-    })
+    registro = sincronizar_catalogo()
+    df_casos = registro["df_casos"]
+    if df_casos is None:
+        with registro["lock"]:
+            df_casos = pd.DataFrame(list(registro["casos"].values()), columns=COLUMNAS_CASOS)
+            registro["df_casos"] = df_casos
+    return df_casos
+
+@st.cache_resource(max_entries=2)
+def obtener_fundamentos(version_catalogo):
+    """
+    Construye una sola vez por versión del catálogo el contenido estático de la
+    pestaña de Fundamentos Teóricos, compartido sin copias entre sesiones. Las ecuaciones se
+    integran en el markdown como bloques $$...$$ para enviar pocos elementos al
+    navegador en lugar de un st.latex por ecuación.
+    """
+    datos_tabla = []
+    for fruta, info in obtener_frutas().items():
+        if fruta != "Personalizado":
+            datos_tabla.append({
+                "Fruta": fruta,
+                "°Brix Típico": info["brix_inicial"],
+                "Categoría": "Alta" if info["brix_inicial"] >= 14 else "Media" if info["brix_inicial"] >= 10 else "Baja"
+            })
+
+    return {
+        "brix": """
+        Los **grados Brix (°Brix)** son una medida de la concentración de sólidos solubles en un líquido,
+        expresada como porcentaje en masa. En la industria alimentaria, principalmente representan
+        el contenido de azúcares en jugos, pulpas y néctares de frutas.
+
+        **Definición práctica:**
+        - 1°Brix = 1 gramo de sólidos solubles en 100 gramos de solución
+        - A 20°C, 1°Brix ≈ 1% de sacarosa en peso
+
+        **Importancia en la industria:**
+        - ✅ Control de calidad del producto
+        - ✅ Estandarización de procesos
+        - ✅ Predicción de rendimientos
+        - ✅ Determinación de punto final en concentración
+        - ✅ Cálculo de formulaciones
+        """,
+        "medicion": """
+        **📏 Medición**
+
+        Se mide con un **refractómetro**,
+        que aprovecha la relación
+        entre la concentración de
+        azúcares y el índice de
+        refracción de la luz.
+
+        **Rango típico:**
+        - Frutas frescas: 8-20°Brix
+        - Néctares: 12-16°Brix
+        - Mermeladas: 60-70°Brix
+        """,
+        "tabla_frutas": pd.DataFrame(datos_tabla),
+        "balance": r"""
+El **balance de materia** se basa en la **Ley de Conservación de la Masa**:
+
+> *"La masa no se crea ni se destruye, solo se transforma"*
+
+En nuestro caso específico:
+
+$$
+\text{Masa Total Entrada} = \text{Masa Total Salida}
+$$
+
+$$
+\text{Sólidos Entrada} = \text{Sólidos Salida}
+$$
+
+### 🔬 Deducción de la Fórmula
+""",
+        "deduccion": r"""
+**Datos conocidos:**
+- $M_i$ = Masa inicial de pulpa (kg)
+- $C_i$ = Concentración inicial (°Brix como decimal)
+- $C_f$ = Concentración final objetivo (°Brix como decimal)
+- $A$ = Azúcar a agregar (kg) - **INCÓGNITA**
+
+**Paso 1:** Calcular sólidos iniciales en la pulpa
+
+$$
+S_i = M_i \times C_i
+$$
+
+**Paso 2:** Plantear balance de materia total
+
+$$
+M_f = M_i + A
+$$
+
+**Paso 3:** Plantear balance de sólidos
+
+$$
+S_f = S_i + A
+$$
+
+**Paso 4:** Aplicar definición de concentración final
+
+$$
+C_f = \frac{S_f}{M_f} = \frac{S_i + A}{M_i + A}
+$$
+
+**Paso 5:** Despejar A (azúcar a agregar)
+
+$$
+C_f(M_i + A) = S_i + A
+$$
+
+$$
+C_f \cdot M_i + C_f \cdot A = S_i + A
+$$
+
+$$
+C_f \cdot A - A = S_i - C_f \cdot M_i
+$$
+
+$$
+A(C_f - 1) = S_i - C_f \cdot M_i
+$$
+
+**Fórmula final:**
+
+$$
+A = \frac{M_i \cdot C_f - S_i}{1 - C_f} = \frac{M_i \cdot C_f - M_i \cdot C_i}{1 - C_f}
+$$
+""",
+        "ejemplo": r"""
+**Problema:**
+Se tienen 100 kg de pulpa de fresa con 8°Brix. Se desea llevarla a 65°Brix para elaborar mermelada.
+¿Cuánta azúcar se debe agregar?
+
+**Solución:**
+
+**Datos:**
+- $M_i = 100$ kg
+- $C_i = 8\% = 0.08$
+- $C_f = 65\% = 0.65$
+
+**Paso 1:** Sólidos iniciales
+
+$$
+S_i = 100 \times 0.08 = 8 \text{ kg}
+$$
+
+**Paso 2:** Aplicar fórmula
+
+$$
+A = \frac{100 \times 0.65 - 8}{1 - 0.65} = \frac{65 - 8}{0.35} = \frac{57}{0.35} = 162.86 \text{ kg}
+$$
+
+**Paso 3:** Verificación
+
+$$
+M_f = 100 + 162.86 = 262.86 \text{ kg}
+$$
+
+$$
+S_f = 8 + 162.86 = 170.86 \text{ kg}
+$$
+
+$$
+C_f = \frac{170.86}{262.86} \times 100 = 65.0\%
+$$
+""",
+        "aplicaciones": """
+        **🏭 Casos de Uso Comunes:**
+
+        1. **Elaboración de Mermeladas**
+           - Concentración: 60-70°Brix
+           - Propósito: Conservación y textura
+
+        2. **Producción de Néctares**
+           - Concentración: 12-16°Brix
+           - Propósito: Estandarización del sabor
+
+        3. **Concentrados de Fruta**
+           - Concentración: 60-72°Brix
+           - Propósito: Reducción de volumen para transporte
+
+        4. **Jarabes y Almíbares**
+           - Ligero: 20-30°Brix
+           - Pesado: 40-50°Brix
+           - Propósito: Conservación de frutas
+        """,
+        "estandares": """
+        **📋 Estándares de Calidad:**
+
+        - **CODEX Alimentarius:** Normas internacionales
+        - **FDA:** Regulaciones en Estados Unidos
+        - **INVIMA:** Normativa en Colombia
+
+        **💡 Tips Prácticos:**
+
+        - Siempre medir °Brix a 20°C para precisión
+        - Considerar pérdidas por evaporación
+        - Ajustar según acidez de la fruta
+        - Verificar °Brix en producto final
+        - Registrar todos los parámetros del proceso
+        """,
+        "consideraciones": """
+    **⚠️ Consideraciones Importantes:**
+
+    - Los °Brix representan TODOS los sólidos solubles, no solo azúcares (incluyen ácidos, sales, proteínas)
+    - En frutas, típicamente 80-90% de los sólidos son azúcares
+    - La temperatura afecta la medición: calibrar refractómetro a 20°C
+    - Durante la cocción, hay pérdida de agua por evaporación que aumenta la concentración
+    """
+    }
 
 # ===========================
 # FUNCIONES DE CÁLCULO
@@ -77,39 +493,763 @@ def calcular_azucar(masa_pulpa_inicial, brix_inicial, brix_objetivo):
 
     solidos_iniciales = masa_pulpa_inicial * concentracion_inicial
 
-    try:
-        azucar_a_agregar = (masa_pulpa_inicial * concentracion_objetivo - solidos_iniciales) / (1 - concentracion_objetivo)
-    except ZeroDivisionError:
-        return None, "Los °Brix objetivo no pueden ser 100%."
+    try:
+        azucar_a_agregar = (masa_pulpa_inicial * concentracion_objetivo - solidos_iniciales) / (1 - concentracion_objetivo)
+    except ZeroDivisionError:
+        return None, "Los °Brix objetivo no pueden ser 100%."
+
+    return azucar_a_agregar, None
+
+def calcular_mezcla(masa_pulpa_inicial, brix_inicial, brix_objetivo, brix_aditivo):
+    """
+    Calcula la cantidad (en kg) de un aditivo con °Brix conocidos (jarabe, concentrado
+    o azúcar pura con 100 °Brix) que se debe mezclar con la pulpa para alcanzar los
+    °Brix objetivo. El objetivo debe estar entre los °Brix de las dos corrientes.
+    """
+    concentracion_inicial = brix_inicial / 100.0
+    concentracion_objetivo = brix_objetivo / 100.0
+    concentracion_aditivo = brix_aditivo / 100.0
+
+    if concentracion_aditivo == concentracion_inicial:
+        return None, "Los °Brix del aditivo deben ser distintos a los de la pulpa."
+
+    if not min(concentracion_inicial, concentracion_aditivo) < concentracion_objetivo < max(concentracion_inicial, concentracion_aditivo):
+        return None, f"Los °Brix objetivo deben estar entre los de la pulpa ({brix_inicial}%) y los del aditivo ({brix_aditivo}%)."
+
+    aditivo_a_agregar = masa_pulpa_inicial * (concentracion_objetivo - concentracion_inicial) / (concentracion_aditivo - concentracion_objetivo)
+    return aditivo_a_agregar, None
+
+def calcular_mezcla_vectorizado(masa_pulpa_inicial, brix_inicial, brix_objetivo, brix_aditivo, dtype=np.float64):
+    """
+    Versión vectorizada de calcular_mezcla para arreglos de NumPy con broadcasting.
+    Retorna NaN en los casos donde el objetivo no está entre las dos corrientes.
+    Con dtype=np.float32 todo el cálculo se hace en precisión simple (ruta masiva).
+    """
+    cien = dtype(100)
+    masa = np.asarray(masa_pulpa_inicial, dtype=dtype)
+    concentracion_inicial = np.asarray(brix_inicial, dtype=dtype) / cien
+    concentracion_objetivo = np.asarray(brix_objetivo, dtype=dtype) / cien
+    concentracion_aditivo = np.asarray(brix_aditivo, dtype=dtype) / cien
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aditivo_a_agregar = masa * (concentracion_objetivo - concentracion_inicial) / (concentracion_aditivo - concentracion_objetivo)
+
+    factible = (
+        (concentracion_objetivo > np.minimum(concentracion_inicial, concentracion_aditivo))
+        & (concentracion_objetivo < np.maximum(concentracion_inicial, concentracion_aditivo))
+    )
+    return np.where(factible, aditivo_a_agregar, dtype(np.nan))
+
+def redondear_exacto(valor, decimales):
+    """Redondea una fracción a `decimales` con la regla half-up y la retorna como Decimal"""
+    escalado = abs(valor) * 10 ** decimales
+    entero, resto = divmod(escalado.numerator, escalado.denominator)
+    if 2 * resto >= escalado.denominator:
+        entero += 1
+    return (Decimal(entero) if valor >= 0 else -Decimal(entero)).scaleb(-decimales)
+
+def calcular_mezcla_exacta(masa_pulpa_inicial, brix_inicial, brix_objetivo, brix_aditivo=100.0, decimales=3):
+    """
+    Ruta exacta para hojas de auditoría: cada entrada se toma por su representación
+    decimal y el balance se resuelve con aritmética racional (Fraction), sin error de
+    punto flotante. El resultado se redondea una sola vez con la regla half-up.
+
+    Retorna una lista con un Decimal por caso (una Fraction si decimales=None) o None
+    si el objetivo no está entre las dos corrientes.
+    """
+    resultados = []
+    for masa, inicial, objetivo, aditivo in np.broadcast(
+        np.atleast_1d(masa_pulpa_inicial), np.atleast_1d(brix_inicial),
+        np.atleast_1d(brix_objetivo), np.atleast_1d(brix_aditivo)
+    ):
+        masa, inicial, objetivo, aditivo = (Fraction(str(valor)) for valor in (masa, inicial, objetivo, aditivo))
+
+        if not min(inicial, aditivo) < objetivo < max(inicial, aditivo):
+            resultados.append(None)
+            continue
+
+        # Las concentraciones en % se simplifican en el cociente, no hace falta dividir por 100
+        exacto = masa * (objetivo - inicial) / (aditivo - objetivo)
+        resultados.append(exacto if decimales is None else redondear_exacto(exacto, decimales))
+
+    return resultados
+
+def comparar_precisiones(masas, brix_iniciales, brix_objetivos, brix_aditivo=100.0):
+    """
+    Calcula un lote con las rutas float32, float64 y exacta y reporta el tiempo de
+    cada una y la máxima divergencia de las rutas de punto flotante respecto a la exacta.
+    """
+    inicio = time.perf_counter()
+    exactos = calcular_mezcla_exacta(masas, brix_iniciales, brix_objetivos, brix_aditivo, decimales=None)
+    tiempo_exacto = time.perf_counter() - inicio
+    referencia = np.array([np.nan if valor is None else float(valor) for valor in exactos])
+
+    filas = []
+    for nombre, dtype in (("float32", np.float32), ("float64", np.float64)):
+        inicio = time.perf_counter()
+        valores = calcular_mezcla_vectorizado(masas, brix_iniciales, brix_objetivos, brix_aditivo, dtype=dtype)
+        tiempo = time.perf_counter() - inicio
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            error_absoluto = np.abs(valores.astype(np.float64) - referencia)
+            error_relativo = error_absoluto / np.abs(referencia)
+
+        filas.append({
+            "Ruta": nombre,
+            "Tiempo (ms)": tiempo * 1000,
+            "Divergencia Máx. (kg)": np.nanmax(error_absoluto) if np.isfinite(referencia).any() else 0.0,
+            "Divergencia Relativa Máx.": np.nanmax(error_relativo[referencia != 0]) if (referencia != 0).any() else 0.0,
+            "Factibilidad Distinta": int((np.isnan(valores) != np.isnan(referencia)).sum())
+        })
+
+    filas.append({
+        "Ruta": "exacta (Fraction)",
+        "Tiempo (ms)": tiempo_exacto * 1000,
+        "Divergencia Máx. (kg)": 0.0,
+        "Divergencia Relativa Máx.": 0.0,
+        "Factibilidad Distinta": 0
+    })
+
+    return pd.DataFrame(filas)
+
+def calcular_azucar_vectorizado(masa_pulpa_inicial, brix_inicial, brix_objetivo):
+    """
+    Versión vectorizada de calcular_azucar para arreglos de NumPy con broadcasting.
+    Retorna NaN en los casos donde el ajuste no es posible.
+    """
+    return calcular_mezcla_vectorizado(masa_pulpa_inicial, brix_inicial, brix_objetivo, 100.0)
+
+def calcular_dilucion(masa_inicial, brix_inicial, brix_objetivo):
+    """Calcula cantidad de agua para reducir °Brix"""
+    concentracion_inicial = brix_inicial / 100.0
+    concentracion_objetivo = brix_objetivo / 100.0
+
+    if concentracion_objetivo >= concentracion_inicial:
+        return None, "Los °Brix objetivo deben ser menores que los iniciales para dilución."
+
+    if concentracion_objetivo == 0:
+        return None, "Los °Brix objetivo no pueden ser 0%."
+
+    agua_agregar = masa_inicial * (concentracion_inicial - concentracion_objetivo) / concentracion_objetivo
+    return agua_agregar, None
+
+def calcular_brix_alcanzable(masa_pulpa_inicial, brix_inicial, azucar_disponible):
+    """
+    Calcula los °Brix que alcanza la pulpa al agregar todo el azúcar disponible.
+    Despeja C_f del balance de sólidos: C_f = (M_i·C_i + A) / (M_i + A).
+    """
+    masa = np.asarray(masa_pulpa_inicial, dtype=float)
+    azucar = np.asarray(azucar_disponible, dtype=float)
+    return (masa * np.asarray(brix_inicial, dtype=float) / 100.0 + azucar) / (masa + azucar) * 100.0
+
+def calcular_pulpa_maxima(brix_inicial, brix_objetivo, azucar_disponible):
+    """
+    Calcula la masa máxima de pulpa (kg) que se puede llevar a los °Brix objetivo
+    con el azúcar disponible: M_i = A·(1 - C_f) / (C_f - C_i). Retorna NaN si no es posible.
+    """
+    concentracion_inicial = np.asarray(brix_inicial, dtype=float) / 100.0
+    concentracion_objetivo = np.asarray(brix_objetivo, dtype=float) / 100.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        masa = np.asarray(azucar_disponible, dtype=float) * (1 - concentracion_objetivo) / (concentracion_objetivo - concentracion_inicial)
+
+    factible = (concentracion_objetivo > concentracion_inicial) & (concentracion_objetivo < 1)
+    return np.where(factible, masa, np.nan)
+
+def calcular_brix_dilucion_alcanzable(masa_inicial, brix_inicial, agua_disponible):
+    """Calcula los °Brix que alcanza la pulpa al agregar toda el agua disponible"""
+    masa = np.asarray(masa_inicial, dtype=float)
+    return masa * np.asarray(brix_inicial, dtype=float) / (masa + np.asarray(agua_disponible, dtype=float))
+
+def calcular_pulpa_maxima_dilucion(brix_inicial, brix_objetivo, agua_disponible):
+    """
+    Calcula la masa máxima de pulpa (kg) que se puede diluir a los °Brix objetivo
+    con el agua disponible: M_i = W·C_f / (C_i - C_f). Retorna NaN si no es posible.
+    """
+    concentracion_inicial = np.asarray(brix_inicial, dtype=float) / 100.0
+    concentracion_objetivo = np.asarray(brix_objetivo, dtype=float) / 100.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        masa = np.asarray(agua_disponible, dtype=float) * concentracion_objetivo / (concentracion_inicial - concentracion_objetivo)
+
+    factible = (concentracion_objetivo < concentracion_inicial) & (concentracion_objetivo > 0)
+    return np.where(factible, masa, np.nan)
+
+def calcular_brix_comun_alcanzable(masas, brix_iniciales, azucar_disponible, iteraciones=60):
+    """
+    Calcula el °Brix común más alto que alcanzan todos los lotes repartiendo el
+    azúcar disponible entre ellos. Los lotes que ya superan ese °Brix no reciben
+    azúcar, por lo que la ecuación Σ calcular_azucar(M, C_i, C_f) = A es definida
+    por tramos y se resuelve por bisección, vectorizada sobre los lotes y sobre
+    varios valores de azúcar disponible a la vez.
+
+    Retorna (brix_comun, azucar_por_lote): arreglos (s,) y (s, n) para s valores
+    de azúcar disponible y n lotes.
+    """
+    masas = np.asarray(masas, dtype=float)
+    brix_iniciales = np.asarray(brix_iniciales, dtype=float)
+    azucar = np.atleast_1d(np.asarray(azucar_disponible, dtype=float))
+
+    def azucar_requerida(brix):
+        faltante = np.clip(brix[:, np.newaxis] - brix_iniciales[np.newaxis, :], 0.0, None) / 100.0
+        return masas * faltante / (1 - brix[:, np.newaxis] / 100.0)
+
+    # El azúcar requerida crece con el °Brix común, así que la raíz queda acotada
+    # entre el menor °Brix inicial y 100 °Brix
+    bajo = np.full(azucar.shape, brix_iniciales.min())
+    alto = np.full(azucar.shape, 100.0 - 1e-9)
+    for _ in range(iteraciones):
+        medio = (bajo + alto) / 2
+        excede = azucar_requerida(medio).sum(axis=1) > azucar
+        alto = np.where(excede, medio, alto)
+        bajo = np.where(excede, bajo, medio)
+
+    return bajo, azucar_requerida(bajo)
+
+# Componentes controlados en la formulación multicomponente (filas) y aditivos
+# disponibles para ajustarlos (columnas). El azúcar, el ácido cítrico y la pectina
+# son sólidos solubles, por lo que todos aportan a los °Brix.
+COMPONENTES = ["°Brix", "Acidez", "Pectina"]
+ADITIVOS = ["Azúcar", "Ácido cítrico", "Pectina"]
+APORTE_ADITIVOS = np.array([
+    [1.0, 1.0, 1.0],
+    [0.0, 1.0, 0.0],
+    [0.0, 0.0, 1.0]
+])
+
+def calcular_balance_multicomponente(masas, composicion_inicial, composicion_objetivo, aporte_aditivos=APORTE_ADITIVOS):
+    """
+    Resuelve simultáneamente las cantidades (kg) de cada aditivo para un lote de pulpas.
+
+    Para cada componente i y lote n se plantea el balance
+    M·x_i + Σ_j E_ij·A_j = t_i·(M + Σ_j A_j), que se reordena como el sistema lineal
+    Σ_j (E_ij - t_i)·A_j = M·(t_i - x_i) y se resuelve para todos los lotes a la vez.
+
+    masas: arreglo (n,) en kg
+    composicion_inicial, composicion_objetivo: arreglos (n, k) en %
+    aporte_aditivos: matriz (k, k) con la fracción de cada componente que aporta cada aditivo
+
+    Retorna (aditivos, errores): aditivos es un arreglo (n, k) en kg (NaN si el lote no es
+    factible) y errores una lista con None o el motivo de infactibilidad de cada lote.
+    """
+    masas = np.atleast_1d(np.asarray(masas, dtype=float))
+    x = np.atleast_2d(np.asarray(composicion_inicial, dtype=float)) / 100.0
+    t = np.atleast_2d(np.asarray(composicion_objetivo, dtype=float)) / 100.0
+    aporte = np.asarray(aporte_aditivos, dtype=float)
+    n, k = t.shape
+
+    matrices = aporte[np.newaxis, :, :] - t[:, :, np.newaxis]
+    terminos = masas[:, np.newaxis] * (t - x)
+
+    # Los sistemas singulares (p. ej. objetivo de 100 °Brix) se reemplazan por la
+    # identidad para no interrumpir la solución del resto de los lotes
+    singulares = np.abs(np.linalg.det(matrices)) < 1e-12
+    matrices[singulares] = np.eye(k)
+    aditivos = np.linalg.solve(matrices, terminos[:, :, np.newaxis])[:, :, 0]
+    aditivos[singulares] = np.nan
+
+    negativos = aditivos < -1e-9
+    errores = []
+    for i in range(n):
+        if singulares[i]:
+            errores.append("Sistema sin solución única: revisa que los objetivos sean menores a 100%.")
+        elif negativos[i].any():
+            retirar = ", ".join(ADITIVOS[j] if k == len(ADITIVOS) else f"aditivo {j + 1}"
+                                for j in np.flatnonzero(negativos[i]))
+            errores.append(f"Infactible: requiere retirar {retirar} (solo se pueden agregar aditivos).")
+        else:
+            errores.append(None)
+
+    aditivos[negativos.any(axis=1)] = np.nan
+    aditivos = np.clip(aditivos, 0.0, None)
+
+    return aditivos, errores
+
+def analizar_casos(casos, masa_pulpa):
+    """Calcula en una sola pasada el azúcar necesaria para todos los casos de estudio"""
+    resultado = casos.copy()
+    azucar = calcular_azucar_vectorizado(masa_pulpa, casos["°Brix Inicial"].to_numpy(), casos["°Brix Objetivo"].to_numpy())
+    resultado["Azúcar Necesaria (kg)"] = azucar
+    resultado["Masa Final (kg)"] = masa_pulpa + azucar
+    resultado["Proporción (%)"] = azucar / masa_pulpa * 100
+    return resultado
+
+def barrer_escenarios(brix_frutas, masas, objetivos):
+    """
+    Evalúa el balance sobre la malla cartesiana fruta × masa × objetivo en una sola pasada.
+    Retorna un arreglo (frutas, masas, objetivos) con el azúcar a agregar en kg.
+    """
+    return calcular_azucar_vectorizado(
+        np.asarray(masas, dtype=float)[np.newaxis, :, np.newaxis],
+        np.asarray(brix_frutas, dtype=float)[:, np.newaxis, np.newaxis],
+        np.asarray(objetivos, dtype=float)[np.newaxis, np.newaxis, :]
+    )
+
+# Límites de lo que se envía al navegador; la malla completa se calcula una vez por configuración
+MAX_PUNTOS_MAPA = 200
+MAX_FILAS_TABLA = 5000
+MAX_ESCENARIOS = 10_000_000
+
+@st.cache_data(max_entries=4, show_spinner="Evaluando escenarios...")
+def resumir_escenarios(frutas, brix_frutas, masa_min, masa_max, n_masas, objetivo_min, objetivo_max, n_objetivos):
+    """
+    Evalúa la malla completa una sola vez por configuración y retorna solo un resumen:
+    conteos, azúcar máxima y los escenarios factibles extremos, ordenados en el servidor
+    (hasta MAX_FILAS_TABLA / 2 con más azúcar y otros tantos con menos).
+    """
+    masas = np.linspace(masa_min, masa_max, n_masas)
+    objetivos = np.linspace(objetivo_min, objetivo_max, n_objetivos)
+    malla = barrer_escenarios(brix_frutas, masas, objetivos)
+
+    valores = malla.ravel()
+    indices_factibles = np.flatnonzero(np.isfinite(valores))
+    n_extremos = MAX_FILAS_TABLA // 2
+
+    if len(indices_factibles) <= MAX_FILAS_TABLA:
+        seleccion = indices_factibles
+    else:
+        factibles = valores[indices_factibles]
+        menores = np.argpartition(factibles, n_extremos)[:n_extremos]
+        mayores = np.argpartition(factibles, -n_extremos)[-n_extremos:]
+        seleccion = indices_factibles[np.concatenate([mayores, menores])]
+    seleccion = seleccion[np.argsort(-valores[seleccion], kind="stable")]
+
+    i_fruta, i_masa, i_obj = np.unravel_index(seleccion, malla.shape)
+    extremos = pd.DataFrame({
+        "Fruta": np.array(frutas)[i_fruta],
+        "Masa (kg)": masas[i_masa].round(2),
+        "°Brix Inicial": np.asarray(brix_frutas)[i_fruta],
+        "°Brix Objetivo": objetivos[i_obj].round(2),
+        "Azúcar a Agregar (kg)": valores[seleccion].round(3)
+    })
+
+    return {
+        "evaluados": malla.size,
+        "factibles": len(indices_factibles),
+        "maxima": float(valores[indices_factibles].max()) if len(indices_factibles) else None,
+        "extremos": extremos
+    }
+
+def submuestrear_indices(total, maximo):
+    """Retorna hasta `maximo` índices equiespaciados en [0, total), incluyendo los extremos"""
+    if total <= maximo:
+        return np.arange(total)
+    return np.unique(np.linspace(0, total - 1, maximo).round().astype(int))
+
+def submuestrear_serie(x, y, maximo):
+    """
+    Reduce una serie ordenada a lo sumo `maximo` puntos conservando, en cada tramo,
+    el mínimo y el máximo para que los picos sigan visibles en el gráfico.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if len(y) <= maximo:
+        return x, y
+
+    tramos = maximo // 2
+    limites = np.linspace(0, len(y), tramos + 1).astype(int)
+    inicio = limites[:-1]
+
+    # Índices del mínimo y del máximo de cada tramo, sin bucles en Python
+    mins = np.minimum.reduceat(y, inicio)
+    maxs = np.maximum.reduceat(y, inicio)
+    tramo = np.repeat(np.arange(tramos), np.diff(limites))
+    idx_min = np.flatnonzero(y == mins[tramo])
+    idx_max = np.flatnonzero(y == maxs[tramo])
+    idx_min = idx_min[np.unique(tramo[idx_min], return_index=True)[1]]
+    idx_max = idx_max[np.unique(tramo[idx_max], return_index=True)[1]]
+
+    indices = np.unique(np.concatenate([idx_min, idx_max]))
+    return x[indices], y[indices]
+
+# ===========================
+# RESULTADO DEL BALANCE
+# ===========================
+
+class ResultadoBalance:
+    """
+    Resultado de un balance pulpa + aditivo. Cada cantidad derivada se calcula la
+    primera vez que se consulta y se reutiliza en métricas, gráficos y verificación.
+    Las entradas no cambian: un cambio de entradas implica un objeto nuevo.
+    """
+
+    def __init__(self, masa_pulpa, brix_inicial, brix_objetivo, brix_aditivo=100.0):
+        self.entradas = (float(masa_pulpa), float(brix_inicial), float(brix_objetivo), float(brix_aditivo))
+        self.masa_pulpa, self.brix_inicial, self.brix_objetivo, self.brix_aditivo = self.entradas
+
+    @cached_property
+    def mezcla(self):
+        """(cantidad de aditivo, error) según calcular_mezcla"""
+        return calcular_mezcla(*self.entradas)
+
+    @property
+    def cantidad_aditivo(self):
+        return self.mezcla[0]
+
+    @property
+    def error(self):
+        return self.mezcla[1]
+
+    @property
+    def es_azucar_pura(self):
+        return self.brix_aditivo >= 100
+
+    @cached_property
+    def solidos_iniciales(self):
+        return self.masa_pulpa * (self.brix_inicial / 100)
+
+    @cached_property
+    def agua_inicial(self):
+        return self.masa_pulpa - self.solidos_iniciales
+
+    @cached_property
+    def solidos_aditivo(self):
+        return self.cantidad_aditivo * (self.brix_aditivo / 100)
+
+    @cached_property
+    def agua_aditivo(self):
+        return self.cantidad_aditivo - self.solidos_aditivo
+
+    @cached_property
+    def masa_final(self):
+        return self.masa_pulpa + self.cantidad_aditivo
+
+    @cached_property
+    def solidos_finales(self):
+        return self.solidos_iniciales + self.solidos_aditivo
+
+    @cached_property
+    def agua_final(self):
+        return self.agua_inicial + self.agua_aditivo
+
+    @cached_property
+    def brix_final(self):
+        return (self.solidos_finales / self.masa_final) * 100
+
+    @cached_property
+    def porcentaje_aditivo(self):
+        """Porcentaje del aditivo en la mezcla final"""
+        return (self.cantidad_aditivo / self.masa_final) * 100
+
+    @cached_property
+    def proporcion_aditivo(self):
+        """Porcentaje del aditivo respecto a la pulpa inicial"""
+        return (self.cantidad_aditivo / self.masa_pulpa) * 100
+
+    @cached_property
+    def valor_auditoria(self):
+        """Cantidad de aditivo con aritmética exacta, para auditoría"""
+        return calcular_mezcla_exacta(*self.entradas)[0]
+
+def obtener_resultado_balance(masa_pulpa, brix_inicial, brix_objetivo, brix_aditivo=100.0, clave="resultado_balance"):
+    """
+    Retorna el ResultadoBalance guardado en la sesión si sus entradas no cambiaron;
+    en caso contrario lo reemplaza por uno nuevo (sin valores calculados).
+    """
+    entradas = (float(masa_pulpa), float(brix_inicial), float(brix_objetivo), float(brix_aditivo))
+    resultado = st.session_state.get(clave)
+    if resultado is None or resultado.entradas != entradas:
+        resultado = ResultadoBalance(*entradas)
+        st.session_state[clave] = resultado
+    return resultado
+
+# ===========================
+# PROGRAMACIÓN DE TANQUES
+# ===========================
+
+COLUMNAS_LOTES = ["Masa (kg)", "°Brix Inicial", "°Brix Objetivo"]
+
+def leer_lotes_csv(archivo):
+    """
+    Lee un CSV de lotes y retorna (DataFrame, error). Las columnas de COLUMNAS_LOTES
+    se convierten a números; las filas con valores no numéricos se descartan y se
+    informan en el error.
+    """
+    vacio = pd.DataFrame(columns=COLUMNAS_LOTES)
+    try:
+        df = pd.read_csv(archivo)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as error:
+        return vacio, f"No se pudo leer el archivo: {error}"
+
+    faltantes = [columna for columna in COLUMNAS_LOTES if columna not in df.columns]
+    if faltantes:
+        return vacio, f"Faltan columnas en el archivo: {', '.join(faltantes)}"
+
+    df = df[COLUMNAS_LOTES]
+    numericos = df.apply(pd.to_numeric, errors="coerce")
+    invalidas = (numericos.isna() & df.notna()).any(axis=1)
+    if invalidas.any():
+        filas = ", ".join(str(fila + 2) for fila in np.flatnonzero(invalidas)[:10])
+        return numericos[~invalidas], (f"Se descartaron {int(invalidas.sum())} filas con valores no numéricos "
+                                       f"(filas del archivo: {filas}{'...' if invalidas.sum() > 10 else ''})")
+    return numericos, None
+
+def empacar_lotes(tamanos, capacidad):
+    """
+    Empaca lotes en cargas de tanque con la heurística best-fit decreasing:
+    cada lote, de mayor a menor, va a la carga con menor espacio libre donde cabe.
+    Retorna un arreglo con el índice de carga de cada lote.
+    """
+    cargas = np.empty(len(tamanos), dtype=int)
+    libres = []  # (espacio libre, índice de carga), ordenado por espacio libre
+    n_cargas = 0
+
+    for i in np.argsort(-np.asarray(tamanos), kind="stable"):
+        pos = bisect.bisect_left(libres, (tamanos[i], -1))
+        if pos < len(libres):
+            libre, carga = libres.pop(pos)
+        else:
+            libre, carga = capacidad, n_cargas
+            n_cargas += 1
+        cargas[i] = carga
+        bisect.insort(libres, (libre - tamanos[i], carga))
+
+    return cargas
+
+def programar_tanques(masas, brix_iniciales, brix_objetivos, capacidad_tanque, n_tanques, azucar_disponible=np.inf):
+    """
+    Asigna lotes a tanques de mezcla y turnos respetando la capacidad de los tanques
+    y el azúcar disponible.
+
+    Solo se mezclan en una misma carga lotes con el mismo °Brix objetivo: como el
+    azúcar requerida es lineal en la masa, la carga completa alcanza ese objetivo
+    con la suma del azúcar de sus lotes. Cada carga ocupa un turno del tanque que
+    quede libre primero (cola de prioridad); las cargas que exceden el azúcar
+    restante quedan pendientes.
+
+    Retorna (lotes, cargas): DataFrames con la asignación por lote y por carga.
+    """
+    masas = np.asarray(masas, dtype=float)
+    brix_objetivos = np.asarray(brix_objetivos, dtype=float)
+    azucar = calcular_azucar_vectorizado(masas, brix_iniciales, brix_objetivos)
+    masa_final = masas + azucar
+
+    lotes = pd.DataFrame({
+        "Lote": np.arange(1, len(masas) + 1),
+        "Masa (kg)": masas,
+        "°Brix Inicial": np.asarray(brix_iniciales, dtype=float),
+        "°Brix Objetivo": brix_objetivos,
+        "Azúcar (kg)": azucar,
+        "Masa Final (kg)": masa_final,
+        "Carga": -1,
+        "Tanque": 0,
+        "Turno": 0,
+        "Estado": "Programado"
+    })
+    lotes.loc[np.isnan(azucar), "Estado"] = "Infactible: °Brix objetivo no alcanzable"
+    lotes.loc[masa_final > capacidad_tanque, "Estado"] = "Infactible: excede la capacidad del tanque"
+
+    # Empaque por grupo de °Brix objetivo
+    validos = lotes["Estado"] == "Programado"
+    siguiente = 0
+    for _, grupo in lotes[validos].groupby("°Brix Objetivo", sort=True):
+        cargas_grupo = empacar_lotes(grupo["Masa Final (kg)"].to_numpy(), capacidad_tanque)
+        lotes.loc[grupo.index, "Carga"] = cargas_grupo + siguiente
+        siguiente += cargas_grupo.max() + 1
+
+    cargas = (
+        lotes[validos]
+        .groupby("Carga")
+        .agg(**{
+            "°Brix Objetivo": ("°Brix Objetivo", "first"),
+            "Lotes": ("Lote", "count"),
+            "Masa Final (kg)": ("Masa Final (kg)", "sum"),
+            "Azúcar (kg)": ("Azúcar (kg)", "sum")
+        })
+        .reset_index()
+    )
+    cargas["Tanque"] = 0
+    cargas["Turno"] = 0
+    cargas["Estado"] = "Programado"
+
+    # Asignación de cargas al tanque libre más temprano
+    tanques = [(0, tanque) for tanque in range(1, n_tanques + 1)]
+    heapq.heapify(tanques)
+    azucar_restante = azucar_disponible
+    tanque_carga = np.zeros(len(cargas), dtype=int)
+    turno_carga = np.zeros(len(cargas), dtype=int)
+    azucar_cargas = cargas["Azúcar (kg)"].to_numpy()
+
+    for i in range(len(cargas)):
+        if azucar_cargas[i] > azucar_restante:
+            continue
+        azucar_restante -= azucar_cargas[i]
+        turno, tanque = heapq.heappop(tanques)
+        tanque_carga[i] = tanque
+        turno_carga[i] = turno + 1
+        heapq.heappush(tanques, (turno + 1, tanque))
+
+    cargas["Tanque"] = tanque_carga
+    cargas["Turno"] = turno_carga
+    cargas.loc[tanque_carga == 0, "Estado"] = "Pendiente: azúcar insuficiente"
+
+    asignacion = cargas.set_index("Carga")
+    programados = lotes["Carga"] >= 0
+    lotes.loc[programados, "Tanque"] = asignacion.loc[lotes.loc[programados, "Carga"], "Tanque"].to_numpy()
+    lotes.loc[programados, "Turno"] = asignacion.loc[lotes.loc[programados, "Carga"], "Turno"].to_numpy()
+    lotes.loc[programados & (lotes["Tanque"] == 0), "Estado"] = "Pendiente: azúcar insuficiente"
+
+    return lotes, cargas
+
+# ===========================
+# ARCHIVO HISTÓRICO DE LOTES
+# ===========================
+
+# Un archivo es un directorio con un .npy por columna, todos de la misma longitud
+COLUMNAS_ARCHIVO = ["masa", "brix_inicial", "brix_final", "azucar_usada"]
+TAMANO_BLOQUE = 1_000_000
+BORDES_DISCREPANCIA = np.linspace(-50, 50, 201)  # % de desviación respecto al teórico
+MAX_REGISTROS_EJEMPLO = 10_000_000
+
+# Los archivos solo se leen y escriben dentro de este directorio base
+DIRECTORIO_ARCHIVOS = Path(os.environ.get("BALANCE_ARCHIVOS", str(Path(__file__).with_name("archivo_lotes"))))
+
+def resolver_directorio_archivo(nombre, base=DIRECTORIO_ARCHIVOS):
+    """Retorna (ruta, error) del archivo `nombre` dentro del directorio base, rechazando rutas fuera de él"""
+    base = Path(base).resolve()
+    ruta = (base / str(nombre).strip()).resolve()
+    if not str(nombre).strip() or ruta == base or not ruta.is_relative_to(base):
+        return None, f"El nombre del archivo debe ser un subdirectorio de {base}."
+    return ruta, None
+
+def generar_archivo_ejemplo(directorio, registros, semilla=0, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Genera un archivo de lotes sintético escribiendo cada columna por bloques en un
+    .npy con memoria mapeada, para que la memoria usada no dependa de `registros`.
+    """
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    columnas = {
+        nombre: np.lib.format.open_memmap(directorio / f"{nombre}.npy", mode="w+", dtype=np.float32, shape=(registros,))
+        for nombre in COLUMNAS_ARCHIVO
+    }
+
+    generador = np.random.default_rng(semilla)
+    for inicio in range(0, registros, tamano_bloque):
+        n = min(tamano_bloque, registros - inicio)
+        bloque = slice(inicio, inicio + n)
+        masa = generador.uniform(50, 2000, n)
+        brix_inicial = generador.uniform(6, 18, n)
+        brix_final = generador.choice([14.0, 40.0, 62.0, 65.0, 70.0], n)
+
+        columnas["masa"][bloque] = masa
+        columnas["brix_inicial"][bloque] = brix_inicial
+        columnas["brix_final"][bloque] = brix_final
+        columnas["azucar_usada"][bloque] = calcular_azucar_vectorizado(masa, brix_inicial, brix_final) * generador.normal(1.03, 0.05, n)
+
+    for valores in columnas.values():
+        valores.flush()
+
+def abrir_archivo_lotes(directorio):
+    """
+    Abre un archivo de lotes con memoria mapeada: no se lee nada del disco hasta
+    que se accede a un bloque. Retorna (columnas, error).
+    """
+    directorio = Path(directorio)
+    faltantes = [nombre for nombre in COLUMNAS_ARCHIVO if not (directorio / f"{nombre}.npy").exists()]
+    if faltantes:
+        return None, f"Faltan columnas en el archivo: {', '.join(f'{nombre}.npy' for nombre in faltantes)}"
 
-    return azucar_a_agregar, None
+    columnas = {nombre: np.load(directorio / f"{nombre}.npy", mmap_mode="r") for nombre in COLUMNAS_ARCHIVO}
+    if len({len(valores) for valores in columnas.values()}) != 1:
+        return None, "Todas las columnas del archivo deben tener la misma cantidad de registros."
 
-def calcular_dilucion(masa_inicial, brix_inicial, brix_objetivo):
-    """Calcula cantidad de agua para reducir °Brix"""
-    concentracion_inicial = brix_inicial / 100.0
-    concentracion_objetivo = brix_objetivo / 100.0
+    return columnas, None
 
-    if concentracion_objetivo >= concentracion_inicial:
-        return None, "Los °Brix objetivo deben ser menores que los iniciales para dilución."
+def reproducir_archivo(columnas, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Recalcula el azúcar teórica de cada lote con el balance de materia y la compara
+    con el azúcar realmente usada. Recorre el archivo por bloques acumulando sumas e
+    histogramas, de modo que la memoria usada no depende del número de registros.
+    La media y la varianza de la discrepancia se combinan bloque a bloque con el
+    método de Chan (media y M2 por bloque) para no perder precisión.
+    """
+    total = len(columnas["masa"])
+    validos = 0
+    teorica_total = 0.0
+    real_total = 0.0
+    media = 0.0
+    m2 = 0.0
+    sobreuso = 0
+    minimo = np.inf
+    maximo = -np.inf
+    histograma = np.zeros(len(BORDES_DISCREPANCIA) - 1, dtype=np.int64)
+
+    for inicio in range(0, total, tamano_bloque):
+        bloque = slice(inicio, inicio + tamano_bloque)
+        teorica = calcular_azucar_vectorizado(columnas["masa"][bloque], columnas["brix_inicial"][bloque], columnas["brix_final"][bloque])
+        real = np.asarray(columnas["azucar_usada"][bloque], dtype=np.float64)
+
+        mascara = np.isfinite(teorica) & (teorica > 0)
+        teorica, real = teorica[mascara], real[mascara]
+        discrepancia = real - teorica
+
+        n_bloque = len(discrepancia)
+        teorica_total += teorica.sum()
+        real_total += real.sum()
+        sobreuso += int((discrepancia > 0).sum())
+        if n_bloque:
+            media_bloque = discrepancia.mean()
+            m2_bloque = np.square(discrepancia - media_bloque).sum()
+            delta = media_bloque - media
+            combinados = validos + n_bloque
+            media += delta * n_bloque / combinados
+            m2 += m2_bloque + delta ** 2 * validos * n_bloque / combinados
+            validos = combinados
+
+            minimo = min(minimo, discrepancia.min())
+            maximo = max(maximo, discrepancia.max())
+        histograma += np.histogram(np.clip(discrepancia / teorica * 100, BORDES_DISCREPANCIA[0], BORDES_DISCREPANCIA[-1]),
+                                   bins=BORDES_DISCREPANCIA)[0]
 
-    if concentracion_objetivo == 0:
-        return None, "Los °Brix objetivo no pueden ser 0%."
+    return {
+        "registros": total,
+        "validos": validos,
+        "azucar_teorica": teorica_total,
+        "azucar_real": real_total,
+        "discrepancia_media": media if validos else np.nan,
+        "discrepancia_desviacion": np.sqrt(m2 / validos) if validos else np.nan,
+        "discrepancia_minima": minimo,
+        "discrepancia_maxima": maximo,
+        "porcentaje_sobreuso": sobreuso / validos * 100 if validos else np.nan,
+        "histograma": histograma
+    }
 
-    agua_agregar = masa_inicial * (concentracion_inicial - concentracion_objetivo) / concentracion_objetivo
-    return agua_agregar, None
+def percentil_histograma(histograma, bordes, percentil):
+    """Estima un percentil a partir de un histograma acumulado"""
+    acumulado = np.cumsum(histograma)
+    if acumulado[-1] == 0:
+        return np.nan
+    i = int(np.searchsorted(acumulado, acumulado[-1] * percentil / 100))
+    return (bordes[i] + bordes[i + 1]) / 2
+
+@st.cache_data(show_spinner="Reproduciendo archivo...")
+def reproducir_archivo_cacheado(directorio, firma):
+    """Reproduce un archivo una sola vez por versión (la firma cambia si cambian los .npy)"""
+    columnas, error = abrir_archivo_lotes(directorio)
+    if error:
+        return None, error
+    return reproducir_archivo(columnas), None
+
+def firma_archivo(directorio):
+    """Retorna una firma del archivo basada en el tamaño y la fecha de modificación de sus columnas"""
+    firma = []
+    for nombre in COLUMNAS_ARCHIVO:
+        ruta = Path(directorio) / f"{nombre}.npy"
+        if ruta.exists():
+            estado = ruta.stat()
+            firma.append((nombre, estado.st_size, estado.st_mtime_ns))
+    return tuple(firma)
 
 # ===========================
 # FUNCIONES DE VISUALIZACIÓN
 # ===========================
 
-def crear_grafico_comparativo(masa_pulpa, brix_inicial, cantidad_azucar, brix_objetivo):
+def crear_grafico_comparativo(resultado):
     """Crea gráfico de barras comparando antes y después"""
-    solidos_iniciales = masa_pulpa * (brix_inicial / 100)
-    agua_inicial = masa_pulpa - solidos_iniciales
-
-    masa_final = masa_pulpa + cantidad_azucar
-    solidos_finales = solidos_iniciales + cantidad_azucar
-    agua_final = agua_inicial
+    # El aditivo aporta sólidos y, si no es azúcar pura, también agua
+    solidos_iniciales, solidos_finales = resultado.solidos_iniciales, resultado.solidos_finales
+    agua_inicial, agua_final = resultado.agua_inicial, resultado.agua_final
 
     fig = go.Figure()
 
@@ -143,14 +1283,21 @@ def crear_grafico_comparativo(masa_pulpa, brix_inicial, cantidad_azucar, brix_ob
 
     return fig
 
-def crear_grafico_circular(masa_pulpa, brix_inicial, cantidad_azucar):
+def crear_grafico_circular(resultado):
     """Crea gráfico circular de la composición final"""
-    solidos_iniciales = masa_pulpa * (brix_inicial / 100)
-    agua_inicial = masa_pulpa - solidos_iniciales
-
-    labels = ['Azúcar agregada', 'Sólidos iniciales', 'Agua']
-    values = [cantidad_azucar, solidos_iniciales, agua_inicial]
-    colors = ['#FF6B6B', '#FFE66D', '#4ECDC4']
+    if resultado.es_azucar_pura:
+        labels = ['Azúcar agregada', 'Sólidos iniciales', 'Agua']
+        values = [resultado.cantidad_aditivo, resultado.solidos_iniciales, resultado.agua_inicial]
+        colors = ['#FF6B6B', '#FFE66D', '#4ECDC4']
+    else:
+        labels = ['Sólidos del aditivo', 'Sólidos iniciales', 'Agua de la pulpa', 'Agua del aditivo']
+        values = [
+            resultado.solidos_aditivo,
+            resultado.solidos_iniciales,
+            resultado.agua_inicial,
+            resultado.agua_aditivo
+        ]
+        colors = ['#FF6B6B', '#FFE66D', '#4ECDC4', '#A8E6CF']
 
     fig = go.Figure(data=[go.Pie(
         labels=labels,
@@ -169,9 +1316,10 @@ def crear_grafico_circular(masa_pulpa, brix_inicial, cantidad_azucar):
 
     return fig
 
-def crear_grafico_interactivo(masa_pulpa, brix_inicial, brix_objetivo):
+def crear_grafico_interactivo(resultado):
     """Crea gráfico interactivo mostrando sensibilidad"""
-    cantidad_azucar_objetivo, _ = calcular_azucar(masa_pulpa, brix_inicial, brix_objetivo)
+    cantidad_azucar_objetivo = resultado.cantidad_aditivo
+    brix_objetivo, brix_aditivo = resultado.brix_objetivo, resultado.brix_aditivo
 
     # Generar rango de azúcar alrededor del objetivo
     if cantidad_azucar_objetivo:
@@ -179,13 +1327,9 @@ def crear_grafico_interactivo(masa_pulpa, brix_inicial, brix_objetivo):
         azucar_max = cantidad_azucar_objetivo * 1.5
         azucar_range = np.linspace(azucar_min, azucar_max, 100)
 
-        brix_resultante = []
-        for azucar in azucar_range:
-            solidos_iniciales = masa_pulpa * (brix_inicial / 100)
-            masa_final = masa_pulpa + azucar
-            solidos_finales = solidos_iniciales + azucar
-            brix = (solidos_finales / masa_final) * 100
-            brix_resultante.append(brix)
+        masa_final = resultado.masa_pulpa + azucar_range
+        solidos_finales = resultado.solidos_iniciales + azucar_range * (brix_aditivo / 100)
+        brix_resultante = (solidos_finales / masa_final) * 100
 
         fig = go.Figure()
 
@@ -216,8 +1360,8 @@ def crear_grafico_interactivo(masa_pulpa, brix_inicial, brix_objetivo):
         ))
 
         fig.update_layout(
-            title='Análisis de Sensibilidad: Azúcar vs °Brix',
-            xaxis_title='Azúcar Agregada (kg)',
+            title='Análisis de Sensibilidad: Aditivo vs °Brix' if brix_aditivo < 100 else 'Análisis de Sensibilidad: Azúcar vs °Brix',
+            xaxis_title='Aditivo Agregado (kg)' if brix_aditivo < 100 else 'Azúcar Agregada (kg)',
             yaxis_title='°Brix Resultante (%)',
             hovermode='x unified',
             height=400
@@ -226,15 +1370,21 @@ def crear_grafico_interactivo(masa_pulpa, brix_inicial, brix_objetivo):
         return fig
     return None
 
-def crear_diagrama_flujo(masa_pulpa, brix_inicial, cantidad_azucar, brix_final):
+def crear_diagrama_flujo(resultado):
     """Crea diagrama de flujo del proceso"""
     fig = go.Figure()
 
+    if resultado.es_azucar_pura:
+        texto_proceso = f"PROCESO<br>+ Azúcar: {resultado.cantidad_aditivo:.2f} kg<br>Mezclado"
+    else:
+        texto_proceso = (f"PROCESO<br>+ Aditivo {resultado.brix_aditivo:.0f}°Brix: {resultado.cantidad_aditivo:.2f} kg<br>"
+                         f"(agua: {resultado.agua_aditivo:.2f} kg)")
+
     # Cuadros del diagrama
     boxes = [
-        {"x": 0.15, "y": 0.5, "text": f"ENTRADA<br>Pulpa: {masa_pulpa:.1f} kg<br>°Brix: {brix_inicial:.1f}%", "color": "#4ECDC4"},
-        {"x": 0.5, "y": 0.5, "text": f"PROCESO<br>+ Azúcar: {cantidad_azucar:.2f} kg<br>Mezclado", "color": "#FFE66D"},
-        {"x": 0.85, "y": 0.5, "text": f"SALIDA<br>Total: {masa_pulpa + cantidad_azucar:.2f} kg<br>°Brix: {brix_final:.1f}%", "color": "#95E1D3"}
+        {"x": 0.15, "y": 0.5, "text": f"ENTRADA<br>Pulpa: {resultado.masa_pulpa:.1f} kg<br>°Brix: {resultado.brix_inicial:.1f}%", "color": "#4ECDC4"},
+        {"x": 0.5, "y": 0.5, "text": texto_proceso, "color": "#FFE66D"},
+        {"x": 0.85, "y": 0.5, "text": f"SALIDA<br>Total: {resultado.masa_final:.2f} kg<br>°Brix: {resultado.brix_final:.1f}%", "color": "#95E1D3"}
     ]
 
     # Dibujar cuadros
@@ -285,6 +1435,178 @@ def crear_diagrama_flujo(masa_pulpa, brix_inicial, cantidad_azucar, brix_final):
 
     return fig
 
+def crear_grafico_casos(casos, masa_pulpa):
+    """Crea gráfico de barras comparando el azúcar necesaria y el °Brix de todos los casos"""
+    casos = casos.sort_values("Azúcar Necesaria (kg)")
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        name='Azúcar necesaria',
+        x=casos["Producto"],
+        y=casos["Azúcar Necesaria (kg)"],
+        marker_color='#FF6B6B',
+        text=[f'{azucar:.1f} kg' for azucar in casos["Azúcar Necesaria (kg)"]],
+        textposition='outside'
+    ))
+
+    fig.add_trace(go.Scatter(
+        name='°Brix objetivo',
+        x=casos["Producto"],
+        y=casos["°Brix Objetivo"],
+        mode='markers',
+        marker=dict(size=12, color='#4ECDC4', symbol='diamond'),
+        yaxis='y2'
+    ))
+
+    fig.update_layout(
+        title=f'Azúcar Necesaria por Caso para {masa_pulpa:.1f} kg de Pulpa',
+        xaxis_title='Producto',
+        yaxis=dict(title='Azúcar (kg)'),
+        yaxis2=dict(title='°Brix Objetivo (%)', overlaying='y', side='right', range=[0, 100]),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        height=450
+    )
+
+    return fig
+
+def crear_mapa_calor_escenarios(nombres_frutas, objetivos, azucar, masa):
+    """Crea mapa de calor del azúcar necesaria por fruta y °Brix objetivo"""
+    fig = go.Figure(data=go.Heatmap(
+        z=azucar,
+        x=objetivos,
+        y=nombres_frutas,
+        colorscale='YlOrRd',
+        colorbar=dict(title='Azúcar (kg)'),
+        hovertemplate='%{y}<br>Objetivo: %{x:.1f}°Brix<br>Azúcar: %{z:.2f} kg<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f'Azúcar Necesaria para {masa:.1f} kg de Pulpa',
+        xaxis_title='°Brix Objetivo (%)',
+        yaxis_title='Fruta',
+        height=450
+    )
+
+    return fig
+
+def crear_diagrama_gantt(cargas):
+    """Crea diagrama de Gantt de las cargas programadas por tanque y turno"""
+    fig = go.Figure()
+
+    programadas = cargas[cargas["Tanque"] > 0]
+    for objetivo, grupo in programadas.groupby("°Brix Objetivo"):
+        fig.add_trace(go.Bar(
+            name=f'{objetivo:g}°Brix',
+            x=np.ones(len(grupo)),
+            base=grupo["Turno"] - 1,
+            y=[f'Tanque {tanque}' for tanque in grupo["Tanque"]],
+            orientation='h',
+            customdata=grupo[["Carga", "Lotes", "Masa Final (kg)", "Azúcar (kg)"]].to_numpy(),
+            hovertemplate='Carga %{customdata[0]}<br>Lotes: %{customdata[1]}<br>'
+                          'Masa: %{customdata[2]:.1f} kg<br>Azúcar: %{customdata[3]:.1f} kg<extra></extra>'
+        ))
+
+    fig.update_layout(
+        title='Programación de Tanques por Turno',
+        xaxis_title='Turno',
+        yaxis_title='Tanque',
+        barmode='overlay',
+        bargap=0.2,
+        legend_title='°Brix Objetivo',
+        height=max(300, 40 * programadas["Tanque"].nunique() + 150)
+    )
+
+    return fig
+
+def crear_grafico_uso_diario(uso_diario):
+    """Crea gráfico de barras apiladas del azúcar utilizada por fruta y día"""
+    fig = go.Figure()
+
+    for fruta in uso_diario.columns:
+        fig.add_trace(go.Bar(
+            name=fruta,
+            x=uso_diario.index,
+            y=uso_diario[fruta]
+        ))
+
+    fig.update_layout(
+        title='Azúcar Utilizada por Fruta y Día',
+        barmode='stack',
+        xaxis_title='Fecha',
+        yaxis_title='Azúcar (kg)',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        height=400
+    )
+
+    return fig
+
+def crear_grafico_distribucion_brix(bordes, conteo_inicial, conteo_objetivo):
+    """Crea histograma de °Brix a partir de conteos ya agregados en el servidor"""
+    centros = (bordes[:-1] + bordes[1:]) / 2
+    ancho = bordes[1] - bordes[0]
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(name='°Brix Inicial', x=centros, y=conteo_inicial, width=ancho, marker_color='#4ECDC4', opacity=0.75))
+    fig.add_trace(go.Bar(name='°Brix Objetivo', x=centros, y=conteo_objetivo, width=ancho, marker_color='#FF6B6B', opacity=0.75))
+
+    fig.update_layout(
+        title='Distribución de °Brix',
+        barmode='overlay',
+        xaxis_title='°Brix (%)',
+        yaxis_title='Cálculos',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        height=400
+    )
+
+    return fig
+
+def crear_serie_azucar(fechas, azucar, total_puntos):
+    """Crea serie temporal del azúcar por cálculo con los puntos ya submuestreados"""
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(
+        x=fechas,
+        y=azucar,
+        mode='lines',
+        name='Azúcar por cálculo',
+        line=dict(color='#4ECDC4', width=1)
+    ))
+
+    titulo = 'Azúcar por Cálculo en el Tiempo'
+    if len(azucar) < total_puntos:
+        titulo += f' ({len(azucar):,} de {total_puntos:,} puntos)'
+
+    fig.update_layout(
+        title=titulo,
+        xaxis_title='Fecha',
+        yaxis_title='Azúcar (kg)',
+        height=400
+    )
+
+    return fig
+
+def crear_grafico_discrepancias(histograma, bordes):
+    """Crea histograma de la discrepancia entre azúcar real y teórica"""
+    centros = (bordes[:-1] + bordes[1:]) / 2
+
+    fig = go.Figure(go.Bar(
+        x=centros,
+        y=histograma,
+        width=bordes[1] - bordes[0],
+        marker_color=np.where(centros > 0, '#FF6B6B', '#4ECDC4')
+    ))
+
+    fig.add_vline(x=0, line_dash="dash", line_color="black")
+
+    fig.update_layout(
+        title='Discrepancia Azúcar Real vs Teórica',
+        xaxis_title='Desviación respecto al teórico (%)',
+        yaxis_title='Lotes',
+        height=400
+    )
+
+    return fig
+
 def generar_ejercicio(dificultad):
     """Genera un ejercicio aleatorio según el nivel de dificultad"""
     if dificultad == "Básico":
@@ -309,6 +1631,460 @@ def generar_ejercicio(dificultad):
         "respuesta_correcta": azucar
     }
 
+# ===========================
+# FIGURAS LIVIANAS
+# ===========================
+
+# Plotly 6+ serializa los arreglos de NumPy en binario (base64), donde float32
+# ocupa la mitad que float64; en versiones anteriores se serializan como texto y
+# basta con redondear para acortar cada número
+PLOTLY_BINARIO = int(plotly.__version__.split(".")[0]) >= 6
+DECIMALES_GRAFICO = 3
+MAX_PUNTOS_TRAZA = 2000
+UMBRAL_WEBGL = 1000
+CAMPOS_NUMERICOS = ("x", "y", "z", "values", "base", "width", "customdata")
+
+def reducir_arreglo(valores, indices=None):
+    """Redondea (y submuestrea si se indica) un arreglo numérico de una traza"""
+    arreglo = np.asarray(valores)
+    if indices is not None and arreglo.ndim >= 1 and len(arreglo) > indices[-1]:
+        arreglo = arreglo[indices]
+    if arreglo.dtype.kind != "f":
+        return arreglo
+    arreglo = arreglo.round(DECIMALES_GRAFICO)
+    return arreglo.astype(np.float32) if PLOTLY_BINARIO else arreglo
+
+def aligerar_figura(fig):
+    """
+    Retorna una copia de la figura preparada para enviarse al navegador: elimina la
+    plantilla de estilos (Streamlit aplica su propio tema), pasa a WebGL las trazas
+    de dispersión grandes, submuestrea las que superan MAX_PUNTOS_TRAZA y reduce la
+    precisión de los arreglos a la que se muestra en pantalla.
+    """
+    trazas = []
+    for traza in fig.data:
+        datos = traza.to_plotly_json()
+        longitud = len(datos["y"]) if datos.get("y") is not None and np.ndim(datos["y"]) == 1 else 0
+
+        indices = None
+        if datos["type"] in ("scatter", "scattergl") and longitud > MAX_PUNTOS_TRAZA:
+            indices = submuestrear_indices(longitud, MAX_PUNTOS_TRAZA)
+            if isinstance(datos.get("text"), (list, tuple, np.ndarray)):
+                datos["text"] = np.asarray(datos["text"])[indices]
+        if datos["type"] == "scatter" and longitud > UMBRAL_WEBGL:
+            datos["type"] = "scattergl"
+
+        for campo in CAMPOS_NUMERICOS:
+            if isinstance(datos.get(campo), (list, tuple, np.ndarray)):
+                datos[campo] = reducir_arreglo(datos[campo], indices)
+
+        trazas.append(datos)
+
+    # Una plantilla vacía evita que go.Figure vuelva a aplicar la plantilla por defecto
+    layout = fig.layout.to_plotly_json()
+    layout["template"] = {}
+    return go.Figure({"data": trazas, "layout": layout}, skip_invalid=True)
+
+def medir_payload(fig):
+    """Retorna el tamaño en bytes del JSON que se envía al navegador para la figura"""
+    return len(fig.to_json(validate=False).encode("utf-8"))
+
+def mostrar_grafico(fig):
+    """
+    Muestra una figura con st.plotly_chart. Con el modo de gráficos livianos activo,
+    envía la versión aligerada y registra el tamaño antes/después en reporte_graficos.
+    """
+    if st.session_state.get("graficos_livianos", False):
+        ligera = aligerar_figura(fig)
+        reporte_graficos.append({
+            "Gráfico": fig.layout.title.text or "Sin título",
+            "Original (KB)": round(medir_payload(fig) / 1024, 2),
+            "Liviano (KB)": round(medir_payload(ligera) / 1024, 2)
+        })
+        fig = ligera
+
+    st.plotly_chart(fig, use_container_width=True)
+
+# ===========================
+# REGISTRO DE INTENTOS (SQLITE)
+# ===========================
+
+RUTA_BASE_INTENTOS = os.environ.get(
+    "BALANCE_BASE_INTENTOS",
+    str(Path(__file__).with_name("intentos_ejercicios.db"))
+)
+
+# Además del detalle, se mantienen tablas de resumen actualizadas en cada
+# verificación para que las estadísticas no recorran todo el registro
+ESQUEMA_INTENTOS = """
+CREATE TABLE IF NOT EXISTS ejercicios (
+    id INTEGER PRIMARY KEY,
+    operador TEXT NOT NULL,
+    dificultad TEXT NOT NULL,
+    masa REAL NOT NULL,
+    brix_inicial REAL NOT NULL,
+    brix_objetivo REAL NOT NULL,
+    respuesta_correcta REAL NOT NULL,
+    generado_en REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS verificaciones (
+    id INTEGER PRIMARY KEY,
+    ejercicio_id INTEGER NOT NULL REFERENCES ejercicios(id),
+    respuesta REAL NOT NULL,
+    correcto INTEGER NOT NULL,
+    segundos REAL NOT NULL,
+    verificado_en REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resumen_operador (
+    operador TEXT NOT NULL,
+    dificultad TEXT NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    correctos INTEGER NOT NULL DEFAULT 0,
+    segundos_total REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (operador, dificultad)
+);
+-- Índices de versiones anteriores que ninguna consulta usa; solo encarecían cada inserción
+DROP INDEX IF EXISTS idx_ejercicios_operador;
+DROP INDEX IF EXISTS idx_ejercicios_dificultad;
+CREATE INDEX IF NOT EXISTS idx_verificaciones_ejercicio ON verificaciones(ejercicio_id);
+CREATE INDEX IF NOT EXISTS idx_resumen_intentos ON resumen_operador(intentos DESC);
+"""
+
+def conectar_intentos(ruta=RUTA_BASE_INTENTOS):
+    """Abre una conexión a la base de intentos (una por operación, seguras entre sesiones)"""
+    conexion = sqlite3.connect(ruta, timeout=10)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    return conexion
+
+# pandas envuelve los errores de SQLite de read_sql_query en DatabaseError
+ERRORES_BASE_INTENTOS = (sqlite3.Error, pd.errors.DatabaseError)
+
+@st.cache_resource
+def inicializar_base_intentos(ruta=RUTA_BASE_INTENTOS):
+    """Crea las tablas e índices de la base de intentos una sola vez por proceso"""
+    with closing(conectar_intentos(ruta)) as conexion, conexion:
+        conexion.executescript(ESQUEMA_INTENTOS)
+    return ruta
+
+def abrir_base_intentos():
+    """
+    Retorna (ruta, error). Si la base no se puede crear (p. ej. directorio de solo
+    lectura) no se guarda el fallo en caché y se reintenta en la siguiente ejecución.
+    """
+    try:
+        return inicializar_base_intentos(), None
+    except ERRORES_BASE_INTENTOS as error:
+        return None, f"No se pudo abrir el registro de intentos ({RUTA_BASE_INTENTOS}): {error}"
+
+def registrar_ejercicio(operador, dificultad, ejercicio, ruta=RUTA_BASE_INTENTOS):
+    """Guarda un ejercicio generado. Retorna (id, error)"""
+    try:
+        with closing(conectar_intentos(ruta)) as conexion, conexion:
+            cursor = conexion.execute(
+                "INSERT INTO ejercicios (operador, dificultad, masa, brix_inicial, brix_objetivo, respuesta_correcta, generado_en) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (operador, dificultad, ejercicio["masa"], ejercicio["brix_inicial"], ejercicio["brix_objetivo"],
+                 ejercicio["respuesta_correcta"], time.time())
+            )
+            return cursor.lastrowid, None
+    except ERRORES_BASE_INTENTOS as error:
+        return None, f"No se pudo registrar el ejercicio: {error}"
+
+def registrar_verificacion(ejercicio_id, respuesta, correcto, ruta=RUTA_BASE_INTENTOS):
+    """Guarda una verificación y actualiza el resumen de su operador y dificultad. Retorna (None, error)"""
+    ahora = time.time()
+    try:
+        with closing(conectar_intentos(ruta)) as conexion, conexion:
+            fila = conexion.execute(
+                "SELECT operador, dificultad, generado_en FROM ejercicios WHERE id = ?", (ejercicio_id,)
+            ).fetchone()
+            if fila is None:
+                return None, f"No se pudo registrar la verificación: el ejercicio {ejercicio_id} no está en el registro"
+            operador, dificultad, generado_en = fila
+            segundos = ahora - generado_en
+
+            conexion.execute(
+                "INSERT INTO verificaciones (ejercicio_id, respuesta, correcto, segundos, verificado_en) VALUES (?, ?, ?, ?, ?)",
+                (ejercicio_id, respuesta, int(correcto), segundos, ahora)
+            )
+            conexion.execute(
+                "INSERT INTO resumen_operador (operador, dificultad, intentos, correctos, segundos_total) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT (operador, dificultad) DO UPDATE SET "
+                "intentos = intentos + 1, correctos = correctos + excluded.correctos, "
+                "segundos_total = segundos_total + excluded.segundos_total",
+                (operador, dificultad, int(correcto), segundos)
+            )
+    except ERRORES_BASE_INTENTOS as error:
+        return None, f"No se pudo registrar la verificación: {error}"
+    return None, None
+
+def obtener_estadisticas_dificultad(ruta=RUTA_BASE_INTENTOS):
+    """Retorna (DataFrame, error) con la precisión y el tiempo medio de respuesta por dificultad, a partir del resumen"""
+    try:
+        with closing(conectar_intentos(ruta)) as conexion:
+            return pd.read_sql_query(
+                "SELECT dificultad AS Dificultad, COUNT(*) AS Operadores, SUM(intentos) AS Intentos, "
+                "ROUND(100.0 * SUM(correctos) / SUM(intentos), 1) AS 'Precisión (%)', "
+                "ROUND(SUM(segundos_total) / SUM(intentos), 1) AS 'Tiempo Medio (s)' "
+                "FROM resumen_operador GROUP BY dificultad ORDER BY 1.0 * SUM(correctos) / SUM(intentos)",
+                conexion
+            ), None
+    except ERRORES_BASE_INTENTOS as error:
+        return None, f"No se pudieron leer las estadísticas: {error}"
+
+def obtener_estadisticas_operadores(limite=50, ruta=RUTA_BASE_INTENTOS):
+    """Retorna (DataFrame, error) con los operadores con más intentos, usando el índice del resumen"""
+    try:
+        with closing(conectar_intentos(ruta)) as conexion:
+            return pd.read_sql_query(
+                "SELECT operador AS Operador, dificultad AS Dificultad, intentos AS Intentos, "
+                "ROUND(100.0 * correctos / intentos, 1) AS 'Precisión (%)', "
+                "ROUND(segundos_total / intentos, 1) AS 'Tiempo Medio (s)' "
+                "FROM resumen_operador ORDER BY intentos DESC LIMIT ?",
+                conexion,
+                params=(limite,)
+            ), None
+    except ERRORES_BASE_INTENTOS as error:
+        return None, f"No se pudieron leer las estadísticas: {error}"
+
+# ===========================
+# MEMORIA DE SESIÓN
+# ===========================
+
+# El historial se guarda como tuplas con este orden de columnas en lugar de
+# diccionarios, para no repetir los nombres de columna en cada registro
+HISTORIAL_COLUMNAS = ["Fecha", "Fruta", "Masa Pulpa (kg)", "°Brix Inicial", "°Brix Objetivo",
+                      "Aditivo", "°Brix Aditivo", "Aditivo a Agregar (kg)"]
+MAX_HISTORIAL = 50_000
+SESION_INACTIVA_SEGUNDOS = 30 * 60
+INTERVALO_PODA_SEGUNDOS = 60
+
+# Resultados derivados que se recalculan al volver a pedirlos
+CLAVES_TRANSITORIAS = ("resultado_balance", "resultado_caso", "analisis_historial")
+
+@st.cache_resource
+def obtener_registro_sesiones():
+    """Retorna el registro compartido por todas las sesiones con su última actividad y tamaño"""
+    return {"sesiones": {}, "ultima_poda": 0.0, "lock": threading.Lock()}
+
+# El acceso a otras sesiones depende de atributos internos de Streamlit
+# (Runtime._session_mgr y AppSession._state). Si una versión futura los cambia,
+# las demás sesiones simplemente dejan de medirse y compactarse.
+ERRORES_SESION_AJENA = (AttributeError, KeyError, RuntimeError)
+
+def listar_sesiones_servidor():
+    """
+    Retorna {session_id: SessionInfo} con las sesiones que mantiene el gestor de
+    sesiones de Streamlit, o un diccionario vacío si no hay servidor (p. ej. AppTest)
+    """
+    if not Runtime.exists():
+        return {}
+    try:
+        gestor = Runtime.instance()._session_mgr
+        return {info.session.id: info for info in gestor.list_sessions()}
+    except AttributeError:
+        return {}
+
+def estado_en_reposo(info):
+    """
+    Retorna el session state de una sesión del servidor solo si no está ejecutando
+    su script (su hilo no lo está modificando), o None en caso contrario
+    """
+    try:
+        if info.session._state != AppSessionState.APP_NOT_RUNNING:
+            return None
+        return info.session.session_state
+    except AttributeError:
+        return None
+
+def medir_estado(estado):
+    """Suma los bytes de todas las claves de un session state"""
+    return sum(medir_bytes(valor) for valor in estado.filtered_state.values())
+
+def medir_sesion_ajena(info):
+    """
+    Mide el session state de otra sesión si está en reposo. Retorna None si se está
+    ejecutando o si su estado cambió durante la medición.
+    """
+    estado = estado_en_reposo(info)
+    if estado is None:
+        return None
+    try:
+        return medir_estado(estado)
+    except ERRORES_SESION_AJENA:
+        return None
+
+def medir_bytes(valor):
+    """Estima el tamaño en bytes de un valor a partir de su serialización"""
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(valor)
+
+def inspeccionar_sesion(estado):
+    """Retorna un DataFrame con los bytes ocupados por cada clave del session state"""
+    df = pd.DataFrame(
+        [(str(clave), type(valor).__name__, medir_bytes(valor)) for clave, valor in estado.items()],
+        columns=["Clave", "Tipo", "Bytes"]
+    )
+    return df.sort_values("Bytes", ascending=False, ignore_index=True)
+
+def normalizar_registro_historial(registro):
+    """
+    Convierte un registro del historial en formatos anteriores (diccionario o tupla
+    sin datos del aditivo, cuando solo se usaba azúcar pura) a la tupla actual
+    """
+    if isinstance(registro, dict):
+        registro = tuple(registro[columna] for columna in HISTORIAL_COLUMNAS[:5]) + (registro["Azúcar a Agregar (kg)"],)
+    if len(registro) == 6:
+        registro = registro[:5] + ("Azúcar (sacarosa)", 100.0) + registro[5:]
+    return registro
+
+def historial_a_dataframe(historial):
+    """Convierte el historial en un DataFrame con fechas y el azúcar (sólidos) aportada por cada cálculo"""
+    df = pd.DataFrame(historial, columns=HISTORIAL_COLUMNAS)
+    df["Fecha"] = pd.to_datetime(df["Fecha"])
+    df["Azúcar Utilizada (kg)"] = df["Aditivo a Agregar (kg)"] * df["°Brix Aditivo"] / 100
+    return df
+
+MAX_PUNTOS_SERIE = 2000
+BINS_BRIX = 40
+BORDES_BRIX = np.linspace(0, 100, BINS_BRIX + 1)
+
+def analizar_historial(historial):
+    """Calcula todos los agregados de la pestaña a partir del historial completo"""
+    df_analisis = historial_a_dataframe(historial)
+
+    uso_diario = (
+        df_analisis
+        .groupby([df_analisis["Fecha"].dt.date, "Fruta"])["Azúcar Utilizada (kg)"]
+        .sum()
+        .unstack(fill_value=0.0)
+    )
+
+    fechas, azucar_serie = submuestrear_serie(
+        df_analisis["Fecha"].to_numpy(),
+        df_analisis["Azúcar Utilizada (kg)"].to_numpy(),
+        MAX_PUNTOS_SERIE
+    )
+
+    resumen_frutas = (
+        df_analisis
+        .groupby("Fruta")
+        .agg(**{
+            "Cálculos": ("Fecha", "count"),
+            "Pulpa (kg)": ("Masa Pulpa (kg)", "sum"),
+            "Azúcar (kg)": ("Azúcar Utilizada (kg)", "sum"),
+            "°Brix Inicial Prom.": ("°Brix Inicial", "mean"),
+            "°Brix Objetivo Prom.": ("°Brix Objetivo", "mean")
+        })
+        .round(2)
+        .reset_index()
+    )
+
+    return {
+        "calculos": len(df_analisis),
+        "azucar_total": df_analisis["Azúcar Utilizada (kg)"].sum(),
+        "pulpa_total": df_analisis["Masa Pulpa (kg)"].sum(),
+        "brix_objetivo_promedio": df_analisis["°Brix Objetivo"].mean(),
+        "uso_diario": uso_diario,
+        "conteo_inicial": np.histogram(df_analisis["°Brix Inicial"], bins=BORDES_BRIX)[0],
+        "conteo_objetivo": np.histogram(df_analisis["°Brix Objetivo"], bins=BORDES_BRIX)[0],
+        "fechas": fechas,
+        "azucar_serie": azucar_serie,
+        "resumen_frutas": resumen_frutas
+    }
+
+def obtener_analisis_historial(historial):
+    """
+    Retorna los agregados guardados en la sesión mientras el historial no cambie
+    (mismo largo y mismo último registro); en caso contrario los recalcula.
+    """
+    clave = (len(historial), historial[-1])
+    guardado = st.session_state.get("analisis_historial")
+    if guardado is None or guardado[0] != clave:
+        guardado = (clave, analizar_historial(historial))
+        st.session_state["analisis_historial"] = guardado
+    return guardado[1]
+
+def historial_desactualizado(historial):
+    """Indica si el historial contiene registros en un formato anterior"""
+    return bool(historial) and (isinstance(historial[0], dict) or len(historial[0]) != len(HISTORIAL_COLUMNAS))
+
+def compactar_sesion(estado):
+    """
+    Limita el tamaño del session state: convierte registros antiguos del historial
+    a tuplas, recorta el historial a MAX_HISTORIAL y elimina claves transitorias.
+    """
+    historial = estado["historial"] if "historial" in estado else []
+    if historial_desactualizado(historial):
+        historial = [normalizar_registro_historial(registro) for registro in historial]
+    if len(historial) > MAX_HISTORIAL:
+        historial = historial[-MAX_HISTORIAL:]
+    estado["historial"] = historial
+
+    if ("ejercicio_actual" not in estado or estado["ejercicio_actual"] is None) and "mostrar_solucion" in estado:
+        del estado["mostrar_solucion"]
+
+    for clave in CLAVES_TRANSITORIAS:
+        if clave in estado:
+            del estado[clave]
+
+def podar_sesiones_inactivas(registro, ahora):
+    """
+    Compacta, a través del gestor de sesiones del servidor, el session state de las
+    sesiones que llevan más de SESION_INACTIVA_SEGUNDOS sin actividad, y quita del
+    registro las sesiones que el servidor ya cerró. Las pestañas desconectadas las
+    libera el propio Streamlit al expirar; las que siguen abiertas quedan acotadas
+    por la compactación.
+    """
+    sesiones_servidor = listar_sesiones_servidor()
+
+    for session_id, info in list(registro["sesiones"].items()):
+        inactiva = ahora - info["ultimo_acceso"] > SESION_INACTIVA_SEGUNDOS
+        if session_id not in sesiones_servidor:
+            if sesiones_servidor or inactiva:
+                registro["sesiones"].pop(session_id, None)
+        elif inactiva and not info["compactada"]:
+            # Solo se toca el estado si la sesión no está ejecutando su script; si
+            # empieza una ejecución a mitad de la compactación se reintenta en la
+            # siguiente poda
+            estado = estado_en_reposo(sesiones_servidor[session_id])
+            if estado is None:
+                continue
+            try:
+                compactar_sesion(estado)
+                info["claves"] = len(estado.filtered_state)
+                info["bytes"] = medir_estado(estado)
+            except ERRORES_SESION_AJENA:
+                continue
+            info["compactada"] = True
+
+def registrar_sesion(estado):
+    """
+    Actualiza la actividad de la sesión actual en el registro compartido y, como
+    mucho una vez por INTERVALO_PODA_SEGUNDOS, compacta las sesiones inactivas.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+
+    registro = obtener_registro_sesiones()
+    ahora = time.time()
+
+    with registro["lock"]:
+        anterior = registro["sesiones"].get(ctx.session_id)
+        registro["sesiones"][ctx.session_id] = {
+            "ultimo_acceso": ahora,
+            "claves": len(estado),
+            "bytes": anterior["bytes"] if anterior else None,
+            "compactada": False
+        }
+
+        if ahora - registro["ultima_poda"] > INTERVALO_PODA_SEGUNDOS:
+            registro["ultima_poda"] = ahora
+            podar_sesiones_inactivas(registro, ahora)
+
 # ===========================
 # INICIALIZACIÓN DE SESSION STATE
 # ===========================
@@ -325,6 +2101,14 @@ if 'ejercicios_totales' not in st.session_state:
 if 'ejercicio_actual' not in st.session_state:
     st.session_state.ejercicio_actual = None
 
+if historial_desactualizado(st.session_state.historial):
+    compactar_sesion(st.session_state)
+
+registrar_sesion(st.session_state)
+
+# Tamaño de los gráficos enviados en esta ejecución (modo de gráficos livianos)
+reporte_graficos = []
+
 # ===========================
 # INTERFAZ PRINCIPAL
 # ===========================
@@ -334,11 +2118,15 @@ st.markdown("### Ajuste de °Brix en Pulpas de Frutas")
 st.markdown("---")
 
 # Crear tabs principales
-tab1, tab2, tab3, tab4 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
     "📊 Calculadora Profesional",
     "📚 Fundamentos Teóricos",
     "✏️ Ejercicios Prácticos",
-    "📁 Biblioteca de Casos"
+    "📁 Biblioteca de Casos",
+    "🗺️ Comparación de Escenarios",
+    "🏭 Programación de Tanques",
+    "📈 Análisis del Historial",
+    "🗄️ Archivo Histórico"
 ])
 
 # ===========================
@@ -396,6 +2184,23 @@ with tab1:
             help="Concentración deseada de sólidos solubles"
         )
 
+        aditivos = obtener_aditivos()
+        aditivo_seleccionado = st.selectbox(
+            "Aditivo para el ajuste",
+            options=list(aditivos.keys()),
+            help="Azúcar pura o una corriente líquida (jarabe, concentrado) con °Brix conocidos"
+        )
+
+        brix_aditivo = st.number_input(
+            "°Brix del aditivo (%)",
+            min_value=0.1,
+            max_value=100.0,
+            value=aditivos[aditivo_seleccionado]["brix"],
+            step=0.5,
+            disabled=aditivo_seleccionado == "Azúcar (sacarosa)",
+            help=aditivos[aditivo_seleccionado]["descripcion"]
+        )
+
         st.markdown("---")
 
         calcular = st.button("🔬 Calcular Balance", type="primary", use_container_width=True)
@@ -416,71 +2221,104 @@ with tab1:
 
         calcular_dilucion_btn = st.button("💧 Calcular Dilución", use_container_width=True)
 
+        # Cálculos inversos
+        st.markdown("---")
+        st.subheader("🔁 Cálculos Inversos")
+        st.caption("A partir del azúcar o agua disponible")
+
+        azucar_disponible = st.number_input(
+            "Azúcar disponible (kg)",
+            min_value=0.0,
+            value=25.0,
+            step=1.0,
+            key="inverso_azucar"
+        )
+
+        agua_disponible = st.number_input(
+            "Agua disponible (kg)",
+            min_value=0.0,
+            value=10.0,
+            step=1.0,
+            key="inverso_agua"
+        )
+
+        calcular_inverso_btn = st.button("🔁 Calcular Inverso", use_container_width=True)
+
+        st.markdown("---")
+        st.toggle(
+            "📦 Gráficos livianos",
+            key="graficos_livianos",
+            help="Reduce el tamaño de los gráficos enviados al navegador: WebGL, menor precisión y sin plantilla de estilos"
+        )
+
     # Área principal
     if calcular:
-        cantidad_azucar, error = calcular_azucar(masa_pulpa, brix_inicial, brix_objetivo)
+        resultado = obtener_resultado_balance(masa_pulpa, brix_inicial, brix_objetivo, brix_aditivo)
+        cantidad_azucar = resultado.cantidad_aditivo
+        es_azucar_pura = resultado.es_azucar_pura
+        nombre_aditivo = "Azúcar" if es_azucar_pura else "Aditivo"
 
-        if error:
-            st.error(f"❌ {error}")
+        if resultado.error:
+            st.error(f"❌ {resultado.error}")
         else:
             # Guardar en historial
-            st.session_state.historial.append({
-                "Fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "Fruta": fruta_seleccionada,
-                "Masa Pulpa (kg)": masa_pulpa,
-                "°Brix Inicial": brix_inicial,
-                "°Brix Objetivo": brix_objetivo,
-                "Azúcar a Agregar (kg)": round(cantidad_azucar, 3)
-            })
+            st.session_state.historial.append((
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                fruta_seleccionada,
+                masa_pulpa,
+                brix_inicial,
+                brix_objetivo,
+                aditivo_seleccionado,
+                brix_aditivo,
+                round(cantidad_azucar, 3)
+            ))
+            if len(st.session_state.historial) > MAX_HISTORIAL:
+                del st.session_state.historial[:-MAX_HISTORIAL]
 
             # Métricas principales
             col1, col2, col3, col4 = st.columns(4)
 
             with col1:
-                st.metric("Azúcar a Agregar", f"{cantidad_azucar:.3f} kg", help="Cantidad de azúcar pura necesaria")
+                st.metric(f"{nombre_aditivo} a Agregar", f"{cantidad_azucar:.3f} kg",
+                          help="Cantidad de azúcar pura necesaria" if es_azucar_pura
+                          else f"Cantidad de {aditivo_seleccionado.lower()} a {brix_aditivo:.1f}°Brix necesaria")
 
             with col2:
-                masa_final = masa_pulpa + cantidad_azucar
-                st.metric("Masa Total Final", f"{masa_final:.2f} kg", f"+{cantidad_azucar:.2f} kg")
+                st.metric("Masa Total Final", f"{resultado.masa_final:.2f} kg", f"+{cantidad_azucar:.2f} kg")
 
             with col3:
                 incremento = brix_objetivo - brix_inicial
-                st.metric("Incremento °Brix", f"+{incremento:.1f}%", f"{brix_inicial:.1f}% → {brix_objetivo:.1f}%")
+                st.metric("Cambio °Brix", f"{incremento:+.1f}%", f"{brix_inicial:.1f}% → {brix_objetivo:.1f}%")
 
             with col4:
-                porcentaje_azucar = (cantidad_azucar / masa_final) * 100
-                st.metric("% Azúcar Agregada", f"{porcentaje_azucar:.1f}%", help="Porcentaje de azúcar en la mezcla final")
+                st.metric(f"% {nombre_aditivo} Agregado", f"{resultado.porcentaje_aditivo:.1f}%",
+                          help="Porcentaje del aditivo en la mezcla final")
 
             st.markdown("---")
 
             # Diagrama de flujo
             st.subheader("📈 Diagrama de Flujo del Proceso")
-            solidos_iniciales = masa_pulpa * (brix_inicial / 100)
-            solidos_finales = solidos_iniciales + cantidad_azucar
-            masa_final = masa_pulpa + cantidad_azucar
-            brix_final_verificado = (solidos_finales / masa_final) * 100
-
-            fig_flujo = crear_diagrama_flujo(masa_pulpa, brix_inicial, cantidad_azucar, brix_final_verificado)
-            st.plotly_chart(fig_flujo, use_container_width=True)
+            fig_flujo = crear_diagrama_flujo(resultado)
+            mostrar_grafico(fig_flujo)
 
             # Gráficos comparativos
             col1, col2 = st.columns(2)
 
             with col1:
                 st.subheader("📊 Composición Comparativa")
-                fig_barras = crear_grafico_comparativo(masa_pulpa, brix_inicial, cantidad_azucar, brix_objetivo)
-                st.plotly_chart(fig_barras, use_container_width=True)
+                fig_barras = crear_grafico_comparativo(resultado)
+                mostrar_grafico(fig_barras)
 
             with col2:
                 st.subheader("🥧 Composición Final")
-                fig_circular = crear_grafico_circular(masa_pulpa, brix_inicial, cantidad_azucar)
-                st.plotly_chart(fig_circular, use_container_width=True)
+                fig_circular = crear_grafico_circular(resultado)
+                mostrar_grafico(fig_circular)
 
             # Gráfico interactivo de sensibilidad
             st.subheader("📉 Análisis de Sensibilidad")
-            fig_interactivo = crear_grafico_interactivo(masa_pulpa, brix_inicial, brix_objetivo)
+            fig_interactivo = crear_grafico_interactivo(resultado)
             if fig_interactivo:
-                st.plotly_chart(fig_interactivo, use_container_width=True)
+                mostrar_grafico(fig_interactivo)
 
             # Verificación detallada
             with st.expander("🔍 Ver Verificación Detallada del Cálculo"):
@@ -490,22 +2328,26 @@ with tab1:
                 1. **Composición Inicial:**
                    - Masa de pulpa: {masa_pulpa:.2f} kg
                    - Concentración inicial: {brix_inicial:.2f}%
-                   - Sólidos iniciales: {masa_pulpa:.2f} kg × {brix_inicial/100:.4f} = {solidos_iniciales:.3f} kg
-                   - Agua inicial: {masa_pulpa:.2f} kg - {solidos_iniciales:.3f} kg = {masa_pulpa - solidos_iniciales:.3f} kg
+                   - Sólidos iniciales: {masa_pulpa:.2f} kg × {brix_inicial/100:.4f} = {resultado.solidos_iniciales:.3f} kg
+                   - Agua inicial: {masa_pulpa:.2f} kg - {resultado.solidos_iniciales:.3f} kg = {resultado.agua_inicial:.3f} kg
 
-                2. **Adición de Azúcar:**
-                   - Azúcar agregada: {cantidad_azucar:.3f} kg
+                2. **Adición de {aditivo_seleccionado} ({brix_aditivo:.1f}°Brix):**
+                   - Cantidad agregada: {cantidad_azucar:.3f} kg
+                   - Sólidos aportados: {cantidad_azucar:.3f} kg × {brix_aditivo/100:.4f} = {resultado.solidos_aditivo:.3f} kg
+                   - Agua aportada: {resultado.agua_aditivo:.3f} kg
 
                 3. **Composición Final:**
-                   - Masa total: {masa_pulpa:.2f} kg + {cantidad_azucar:.3f} kg = **{masa_final:.3f} kg**
-                   - Sólidos totales: {solidos_iniciales:.3f} kg + {cantidad_azucar:.3f} kg = **{solidos_finales:.3f} kg**
-                   - Agua: {masa_pulpa - solidos_iniciales:.3f} kg (sin cambio)
+                   - Masa total: {masa_pulpa:.2f} kg + {cantidad_azucar:.3f} kg = **{resultado.masa_final:.3f} kg**
+                   - Sólidos totales: {resultado.solidos_iniciales:.3f} kg + {resultado.solidos_aditivo:.3f} kg = **{resultado.solidos_finales:.3f} kg**
+                   - Agua: {resultado.agua_inicial:.3f} kg + {resultado.agua_aditivo:.3f} kg = {resultado.agua_final:.3f} kg
 
                 4. **Verificación de °Brix:**
                    - °Brix final = (Sólidos totales / Masa total) × 100
-                   - °Brix final = ({solidos_finales:.3f} / {masa_final:.3f}) × 100 = **{brix_final_verificado:.2f}%**
+                   - °Brix final = ({resultado.solidos_finales:.3f} / {resultado.masa_final:.3f}) × 100 = **{resultado.brix_final:.2f}%**
                    - Objetivo: {brix_objetivo:.2f}%
-                   - ✅ Diferencia: {abs(brix_final_verificado - brix_objetivo):.4f}% (despreciable)
+                   - ✅ Diferencia: {abs(resultado.brix_final - brix_objetivo):.4f}% (despreciable)
+
+                5. **Valor de auditoría (aritmética exacta):** {resultado.valor_auditoria} kg
                 """)
 
     elif calcular_dilucion_btn:
@@ -526,6 +2368,32 @@ with tab1:
                 reduccion = brix_inicial - brix_objetivo_dilucion
                 st.metric("Reducción °Brix", f"-{reduccion:.1f}%")
 
+    elif calcular_inverso_btn:
+        brix_con_azucar = calcular_brix_alcanzable(masa_pulpa, brix_inicial, azucar_disponible)
+        pulpa_maxima = calcular_pulpa_maxima(brix_inicial, brix_objetivo, azucar_disponible)
+        brix_con_agua = calcular_brix_dilucion_alcanzable(masa_pulpa, brix_inicial, agua_disponible)
+        pulpa_maxima_dil = calcular_pulpa_maxima_dilucion(brix_inicial, brix_objetivo_dilucion, agua_disponible)
+
+        st.subheader(f"🍬 Con {azucar_disponible:.2f} kg de azúcar")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("°Brix Alcanzable", f"{brix_con_azucar:.2f}%", f"{brix_con_azucar - brix_inicial:+.2f}% sobre {masa_pulpa:.1f} kg")
+        with col2:
+            if np.isnan(pulpa_maxima):
+                st.metric("Pulpa Máxima al Objetivo", "—", help="Los °Brix objetivo deben ser mayores que los iniciales y menores a 100%")
+            else:
+                st.metric("Pulpa Máxima al Objetivo", f"{pulpa_maxima:.2f} kg", f"a {brix_objetivo:.1f}°Brix")
+
+        st.subheader(f"💧 Con {agua_disponible:.2f} kg de agua")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("°Brix Alcanzable", f"{brix_con_agua:.2f}%", f"{brix_con_agua - brix_inicial:+.2f}% sobre {masa_pulpa:.1f} kg")
+        with col2:
+            if np.isnan(pulpa_maxima_dil):
+                st.metric("Pulpa Máxima al Objetivo", "—", help="Los °Brix objetivo de dilución deben ser menores que los iniciales")
+            else:
+                st.metric("Pulpa Máxima al Objetivo", f"{pulpa_maxima_dil:.2f} kg", f"a {brix_objetivo_dilucion:.1f}°Brix")
+
     else:
         st.info("👈 Configura los parámetros en el panel lateral y haz clic en **Calcular Balance**")
 
@@ -557,11 +2425,221 @@ with tab1:
             - Análisis de sensibilidad
             """)
 
+    # Cálculo inverso por lotes: reparto del azúcar disponible
+    st.markdown("---")
+    with st.expander("🔁 Reparto de Azúcar Disponible entre Lotes"):
+        st.caption("Calcula el °Brix común más alto que alcanzan todos los lotes con el azúcar disponible del panel lateral")
+
+        lotes_inverso = st.data_editor(
+            pd.DataFrame({
+                "Lote": ["Lote 1", "Lote 2"],
+                "Masa (kg)": [masa_pulpa, masa_pulpa],
+                "°Brix Inicial": [brix_inicial, brix_inicial + 2.0]
+            }),
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="inverso_lotes"
+        ).dropna()
+
+        if st.button("🔁 Repartir Azúcar", key="inverso_repartir") and not lotes_inverso.empty:
+            brix_comun, azucar_lotes = calcular_brix_comun_alcanzable(
+                lotes_inverso["Masa (kg)"].to_numpy(),
+                lotes_inverso["°Brix Inicial"].to_numpy(),
+                azucar_disponible
+            )
+
+            st.metric("°Brix Común Alcanzable", f"{brix_comun[0]:.2f}%", f"con {azucar_disponible:.2f} kg de azúcar")
+
+            resultados_inverso = lotes_inverso.copy()
+            resultados_inverso["Azúcar Asignada (kg)"] = azucar_lotes[0].round(3)
+            resultados_inverso["°Brix Final"] = calcular_brix_alcanzable(
+                resultados_inverso["Masa (kg)"].to_numpy(),
+                resultados_inverso["°Brix Inicial"].to_numpy(),
+                azucar_lotes[0]
+            ).round(2)
+            st.dataframe(resultados_inverso, use_container_width=True, hide_index=True)
+
+    # Formulación multicomponente por lotes
+    st.markdown("---")
+    with st.expander("🧮 Formulación Multicomponente (°Brix, Acidez y Pectina)"):
+        st.caption("Calcula simultáneamente azúcar, ácido cítrico y pectina para varios lotes")
+
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            acidez_objetivo = st.number_input(
+                "Acidez objetivo (% ác. cítrico)",
+                min_value=0.0,
+                max_value=10.0,
+                value=1.0,
+                step=0.05,
+                key="multi_acidez_objetivo"
+            )
+            usar_relacion = st.checkbox(
+                "Definir por relación °Brix/acidez",
+                key="multi_usar_relacion",
+                help="Calcula la acidez objetivo a partir de la relación °Brix/acidez deseada"
+            )
+
+        with col2:
+            relacion_objetivo = st.number_input(
+                "Relación °Brix/acidez objetivo",
+                min_value=1.0,
+                value=65.0,
+                step=1.0,
+                key="multi_relacion_objetivo",
+                disabled=not usar_relacion
+            )
+
+        with col3:
+            pectina_objetivo = st.number_input(
+                "Pectina objetivo (%)",
+                min_value=0.0,
+                max_value=10.0,
+                value=1.0,
+                step=0.05,
+                key="multi_pectina_objetivo"
+            )
+
+        if usar_relacion:
+            acidez_objetivo = brix_objetivo / relacion_objetivo
+            st.caption(f"Acidez objetivo equivalente: {acidez_objetivo:.3f}%")
+
+        lotes_multi = st.data_editor(
+            pd.DataFrame({
+                "Lote": ["Lote 1"],
+                "Masa (kg)": [masa_pulpa],
+                "°Brix Inicial": [brix_inicial],
+                "Acidez Inicial (%)": [0.8],
+                "Pectina Inicial (%)": [0.5]
+            }),
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="multi_lotes"
+        ).dropna()
+
+        if st.button("🧮 Resolver Formulación", key="multi_resolver") and not lotes_multi.empty:
+            aditivos, errores = calcular_balance_multicomponente(
+                lotes_multi["Masa (kg)"].to_numpy(),
+                lotes_multi[["°Brix Inicial", "Acidez Inicial (%)", "Pectina Inicial (%)"]].to_numpy(),
+                np.tile([brix_objetivo, acidez_objetivo, pectina_objetivo], (len(lotes_multi), 1))
+            )
+
+            resultados_multi = lotes_multi[["Lote", "Masa (kg)"]].copy()
+            for j, aditivo in enumerate(ADITIVOS):
+                resultados_multi[f"{aditivo} (kg)"] = aditivos[:, j].round(3)
+            resultados_multi["Masa Final (kg)"] = (resultados_multi["Masa (kg)"] + aditivos.sum(axis=1)).round(3)
+            resultados_multi["Estado"] = [error or "✅ Factible" for error in errores]
+
+            st.dataframe(resultados_multi, use_container_width=True, hide_index=True)
+
+            infactibles = sum(error is not None for error in errores)
+            if infactibles:
+                st.warning(f"⚠️ {infactibles} de {len(errores)} lotes no son factibles con los objetivos definidos")
+
+    # Modos de precisión numérica
+    st.markdown("---")
+    with st.expander("🎯 Precisión Numérica y Auditoría"):
+        st.caption(f"Calcula lotes con el aditivo del panel lateral ({brix_aditivo:.1f}°Brix) usando la ruta numérica elegida")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            ruta_precision = st.selectbox(
+                "Ruta de cálculo",
+                ["float64 (estándar)", "float32 (masiva)", "Exacta (auditoría)"],
+                key="precision_ruta",
+                help="float32: máximo rendimiento para planeación masiva | Exacta: aritmética racional con redondeo half-up reproducible"
+            )
+
+        with col2:
+            decimales_auditoria = st.number_input(
+                "Decimales de redondeo (auditoría)",
+                min_value=0,
+                max_value=10,
+                value=3,
+                step=1,
+                key="precision_decimales"
+            )
+
+        lotes_precision = st.data_editor(
+            pd.DataFrame({
+                "Masa (kg)": [masa_pulpa],
+                "°Brix Inicial": [brix_inicial],
+                "°Brix Objetivo": [brix_objetivo]
+            }),
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="precision_lotes"
+        ).dropna()
+
+        if st.button("🎯 Calcular con la Ruta Seleccionada", key="precision_calcular") and not lotes_precision.empty:
+            resultados_precision = lotes_precision.copy()
+            argumentos = (
+                lotes_precision["Masa (kg)"].to_numpy(),
+                lotes_precision["°Brix Inicial"].to_numpy(),
+                lotes_precision["°Brix Objetivo"].to_numpy(),
+                brix_aditivo
+            )
+
+            if ruta_precision.startswith("Exacta"):
+                exactos = calcular_mezcla_exacta(*argumentos, decimales=int(decimales_auditoria))
+                # Se muestran como texto para conservar exactamente los dígitos redondeados
+                resultados_precision["Aditivo (kg)"] = ["No factible" if valor is None else str(valor) for valor in exactos]
+            else:
+                dtype = np.float32 if ruta_precision.startswith("float32") else np.float64
+                resultados_precision["Aditivo (kg)"] = calcular_mezcla_vectorizado(*argumentos, dtype=dtype)
+
+            st.dataframe(resultados_precision, use_container_width=True, hide_index=True)
+
+        st.markdown("**Verificación cruzada**")
+        col1, col2 = st.columns([2, 1])
+
+        with col1:
+            casos_verificacion = st.number_input(
+                "Casos aleatorios a comparar",
+                min_value=100,
+                max_value=200_000,
+                value=10_000,
+                step=1000,
+                key="precision_casos"
+            )
+
+        with col2:
+            st.markdown("<br>", unsafe_allow_html=True)
+            verificar_precision = st.button("🔎 Verificación Cruzada", key="precision_verificar", use_container_width=True)
+
+        if verificar_precision:
+            generador = np.random.default_rng(0)
+            n_casos = int(casos_verificacion)
+            comparacion = comparar_precisiones(
+                generador.uniform(1, 5000, n_casos).round(2),
+                generador.uniform(1, 30, n_casos).round(1),
+                generador.uniform(5, 80, n_casos).round(1),
+                brix_aditivo
+            )
+            st.dataframe(
+                comparacion,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Tiempo (ms)": st.column_config.NumberColumn(format="%.2f"),
+                    "Divergencia Máx. (kg)": st.column_config.NumberColumn(format="%.3e"),
+                    "Divergencia Relativa Máx.": st.column_config.NumberColumn(format="%.3e")
+                }
+            )
+
 # ===========================
 # TAB 2: FUNDAMENTOS TEÓRICOS
 # ===========================
 
 with tab2:
+    # Contenido estático preconstruido una sola vez por proceso
+    fundamentos = obtener_fundamentos(sincronizar_catalogo()["version"])
+
     st.header("📚 Fundamentos de Balance de Materia")
 
     # Sección 1: ¿Qué son los °Brix?
@@ -570,136 +2648,32 @@ with tab2:
     col1, col2 = st.columns([2, 1])
 
     with col1:
-        st.markdown("""
-        Los **grados Brix (°Brix)** son una medida de la concentración de sólidos solubles en un líquido,
-        expresada como porcentaje en masa. En la industria alimentaria, principalmente representan
-        el contenido de azúcares en jugos, pulpas y néctares de frutas.
-
-        **Definición práctica:**
-        - 1°Brix = 1 gramo de sólidos solubles en 100 gramos de solución
-        - A 20°C, 1°Brix ≈ 1% de sacarosa en peso
-
-        **Importancia en la industria:**
-        - ✅ Control de calidad del producto
-        - ✅ Estandarización de procesos
-        - ✅ Predicción de rendimientos
-        - ✅ Determinación de punto final en concentración
-        - ✅ Cálculo de formulaciones
-        """)
+        st.markdown(fundamentos["brix"])
 
     with col2:
-        st.info("""
-        **📏 Medición**
-
-        Se mide con un **refractómetro**,
-        que aprovecha la relación
-        entre la concentración de
-        azúcares y el índice de
-        refracción de la luz.
-
-        **Rango típico:**
-        - Frutas frescas: 8-20°Brix
-        - Néctares: 12-16°Brix
-        - Mermeladas: 60-70°Brix
-        """)
+        st.info(fundamentos["medicion"])
 
     st.markdown("---")
 
     # Tabla de valores típicos
     st.subheader("📊 Valores Típicos de °Brix por Fruta")
-
-    frutas_tabla = obtener_frutas()
-    datos_tabla = []
-    for fruta, info in frutas_tabla.items():
-        if fruta != "Personalizado":
-            datos_tabla.append({
-                "Fruta": fruta,
-                "°Brix Típico": info["brix_inicial"],
-                "Categoría": "Alta" if info["brix_inicial"] >= 14 else "Media" if info["brix_inicial"] >= 10 else "Baja"
-            })
-
-    df_frutas = pd.DataFrame(datos_tabla)
-    st.dataframe(df_frutas, use_container_width=True, hide_index=True)
+    st.dataframe(fundamentos["tabla_frutas"], use_container_width=True, hide_index=True)
 
     st.markdown("---")
 
     # Sección 2: Balance de Materia
     st.subheader("2️⃣ Principio de Balance de Materia")
-
-    st.markdown("""
-    El **balance de materia** se basa en la **Ley de Conservación de la Masa**:
-
-    > *"La masa no se crea ni se destruye, solo se transforma"*
-
-    En nuestro caso específico:
-    """)
-
-    st.latex(r"\text{Masa Total Entrada} = \text{Masa Total Salida}")
-    st.latex(r"\text{Sólidos Entrada} = \text{Sólidos Salida}")
-
-    st.markdown("### 🔬 Deducción de la Fórmula")
+    st.markdown(fundamentos["balance"])
 
     with st.expander("Ver deducción matemática paso a paso"):
-        st.markdown("""
-        **Datos conocidos:**
-        - $M_i$ = Masa inicial de pulpa (kg)
-        - $C_i$ = Concentración inicial (°Brix como decimal)
-        - $C_f$ = Concentración final objetivo (°Brix como decimal)
-        - $A$ = Azúcar a agregar (kg) - **INCÓGNITA**
-
-        **Paso 1:** Calcular sólidos iniciales en la pulpa
-        """)
-
-        st.latex(r"S_i = M_i \times C_i")
-
-        st.markdown("**Paso 2:** Plantear balance de materia total")
-        st.latex(r"M_f = M_i + A")
-
-        st.markdown("**Paso 3:** Plantear balance de sólidos")
-        st.latex(r"S_f = S_i + A")
-
-        st.markdown("**Paso 4:** Aplicar definición de concentración final")
-        st.latex(r"C_f = \frac{S_f}{M_f} = \frac{S_i + A}{M_i + A}")
-
-        st.markdown("**Paso 5:** Despejar A (azúcar a agregar)")
-        st.latex(r"C_f(M_i + A) = S_i + A")
-        st.latex(r"C_f \cdot M_i + C_f \cdot A = S_i + A")
-        st.latex(r"C_f \cdot A - A = S_i - C_f \cdot M_i")
-        st.latex(r"A(C_f - 1) = S_i - C_f \cdot M_i")
-
-        st.markdown("**Fórmula final:**")
-        st.latex(r"A = \frac{M_i \cdot C_f - S_i}{1 - C_f} = \frac{M_i \cdot C_f - M_i \cdot C_i}{1 - C_f}")
-
+        st.markdown(fundamentos["deduccion"])
         st.success("✅ Esta es la fórmula implementada en la calculadora")
 
     # Ejemplo numérico
     st.markdown("### 🧮 Ejemplo Numérico Resuelto")
 
     with st.expander("Ver ejemplo completo"):
-        st.markdown("""
-        **Problema:**
-        Se tienen 100 kg de pulpa de fresa con 8°Brix. Se desea llevarla a 65°Brix para elaborar mermelada.
-        ¿Cuánta azúcar se debe agregar?
-
-        **Solución:**
-
-        **Datos:**
-        - $M_i = 100$ kg
-        - $C_i = 8\\% = 0.08$
-        - $C_f = 65\\% = 0.65$
-
-        **Paso 1:** Sólidos iniciales
-        """)
-        st.latex(r"S_i = 100 \times 0.08 = 8 \text{ kg}")
-
-        st.markdown("**Paso 2:** Aplicar fórmula")
-        st.latex(r"A = \frac{100 \times 0.65 - 8}{1 - 0.65} = \frac{65 - 8}{0.35} = \frac{57}{0.35} = 162.86 \text{ kg}")
-
-        st.markdown("**Paso 3:** Verificación")
-        st.latex(r"M_f = 100 + 162.86 = 262.86 \text{ kg}")
-        st.latex(r"S_f = 8 + 162.86 = 170.86 \text{ kg}")
-        st.latex(r"C_f = \frac{170.86}{262.86} \times 100 = 65.0\%")
-
+        st.markdown(fundamentos["ejemplo"])
         st.success("✅ Verificado: Se necesitan 162.86 kg de azúcar")
 
     st.markdown("---")
@@ -710,52 +2684,12 @@ with tab2:
     col1, col2 = st.columns(2)
 
     with col1:
-        st.markdown("""
-        **🏭 Casos de Uso Comunes:**
-
-        1. **Elaboración de Mermeladas**
-           - Concentración: 60-70°Brix
-           - Propósito: Conservación y textura
-
-        2. **Producción de Néctares**
-           - Concentración: 12-16°Brix
-           - Propósito: Estandarización del sabor
-
-        3. **Concentrados de Fruta**
-           - Concentración: 60-72°Brix
-           - Propósito: Reducción de volumen para transporte
-
-        4. **Jarabes y Almíbares**
-           - Ligero: 20-30°Brix
-           - Pesado: 40-50°Brix
-           - Propósito: Conservación de frutas
-        """)
+        st.markdown(fundamentos["aplicaciones"])
 
     with col2:
-        st.markdown("""
-        **📋 Estándares de Calidad:**
-
-        - **CODEX Alimentarius:** Normas internacionales
-        - **FDA:** Regulaciones en Estados Unidos
-        - **INVIMA:** Normativa en Colombia
-
-        **💡 Tips Prácticos:**
-
-        - Siempre medir °Brix a 20°C para precisión
-        - Considerar pérdidas por evaporación
-        - Ajustar según acidez de la fruta
-        - Verificar °Brix en producto final
-        - Registrar todos los parámetros del proceso
-        """)
+        st.markdown(fundamentos["estandares"])
 
-    st.info("""
-    **⚠️ Consideraciones Importantes:**
-
-    - Los °Brix representan TODOS los sólidos solubles, no solo azúcares (incluyen ácidos, sales, proteínas)
-    - En frutas, típicamente 80-90% de los sólidos son azúcares
-    - La temperatura afecta la medición: calibrar refractómetro a 20°C
-    - Durante la cocción, hay pérdida de agua por evaporación que aumenta la concentración
-    """)
+    st.info(fundamentos["consideraciones"])
 
 # ===========================
 # TAB 3: EJERCICIOS PRÁCTICOS
@@ -765,7 +2699,7 @@ with tab3:
     st.header("✏️ Ejercicios Prácticos")
     st.markdown("Pon a prueba tus conocimientos resolviendo problemas de balance de materia")
 
-    col1, col2 = st.columns([2, 1])
+    col1, col2, col3 = st.columns([2, 2, 1])
 
     with col1:
         dificultad = st.selectbox(
@@ -775,6 +2709,15 @@ with tab3:
         )
 
     with col2:
+        operador = st.text_input(
+            "Nombre del estudiante u operador",
+            value="Anónimo",
+            key="operador",
+            help="Identifica tus intentos en las estadísticas de entrenamiento"
+        ).strip() or "Anónimo"
+
+    with col3:
+
         if st.session_state.ejercicios_totales > 0:
             porcentaje = (st.session_state.ejercicios_correctos / st.session_state.ejercicios_totales) * 100
             st.metric(
@@ -792,6 +2735,15 @@ with tab3:
             st.session_state.ejercicio_actual = generar_ejercicio(dificultad)
             st.session_state.mostrar_solucion = False
 
+            # Si el registro no está disponible, el ejercicio sigue funcionando sin guardarse
+            ruta_intentos, error = abrir_base_intentos()
+            if not error:
+                st.session_state.ejercicio_actual["id"], error = registrar_ejercicio(
+                    operador, dificultad, st.session_state.ejercicio_actual, ruta_intentos
+                )
+            if error:
+                st.warning(f"⚠️ {error}")
+
     with col2:
         if st.button("🔄 Reiniciar Contador", use_container_width=True):
             st.session_state.ejercicios_correctos = 0
@@ -830,8 +2782,16 @@ with tab3:
             tolerancia = respuesta_correcta * 0.02  # 2% de tolerancia
 
             st.session_state.ejercicios_totales += 1
+            es_correcta = abs(respuesta_usuario - respuesta_correcta) <= tolerancia
 
-            if abs(respuesta_usuario - respuesta_correcta) <= tolerancia:
+            if ejercicio.get("id") is not None:
+                ruta_intentos, error = abrir_base_intentos()
+                if not error:
+                    _, error = registrar_verificacion(ejercicio["id"], respuesta_usuario, es_correcta, ruta_intentos)
+                if error:
+                    st.warning(f"⚠️ {error}")
+
+            if es_correcta:
                 st.session_state.ejercicios_correctos += 1
                 st.success(f"🎉 ¡Correcto! La respuesta es {respuesta_correcta:.3f} kg de azúcar")
                 st.balloons()
@@ -866,6 +2826,28 @@ with tab3:
     else:
         st.info("👆 Haz clic en 'Generar Nuevo Ejercicio' para comenzar")
 
+    # Estadísticas de todos los estudiantes desde el registro persistente
+    st.markdown("---")
+    with st.expander("📊 Estadísticas de Entrenamiento"):
+        ruta_intentos, error = abrir_base_intentos()
+        if not error:
+            estadisticas_dificultad, error = obtener_estadisticas_dificultad(ruta_intentos)
+
+        if error:
+            st.warning(f"⚠️ {error}")
+        elif estadisticas_dificultad.empty:
+            st.caption("Aún no hay respuestas verificadas en el registro")
+        else:
+            st.markdown("**Por nivel de dificultad** (de menor a mayor precisión)")
+            st.dataframe(estadisticas_dificultad, use_container_width=True, hide_index=True)
+
+            st.markdown("**Estudiantes con más intentos**")
+            estadisticas_operadores, error = obtener_estadisticas_operadores(50, ruta_intentos)
+            if error:
+                st.warning(f"⚠️ {error}")
+            else:
+                st.dataframe(estadisticas_operadores, use_container_width=True, hide_index=True)
+
 # ===========================
 # TAB 4: BIBLIOTECA DE CASOS
 # ===========================
@@ -875,6 +2857,12 @@ with tab4:
     st.markdown("Casos reales de la industria alimentaria con datos típicos de procesamiento")
 
     casos_df = obtener_casos_estudio()
+    catalogo = sincronizar_catalogo()
+
+    if catalogo["error"]:
+        st.warning(f"⚠️ {catalogo['error']}. Se mantiene la última versión válida del catálogo.")
+    if catalogo["descartados"]:
+        st.warning("⚠️ Entradas del catálogo descartadas:\n\n" + "\n".join(f"- {mensaje}" for mensaje in catalogo["descartados"]))
 
     # Filtros
     col1, col2 = st.columns(2)
@@ -882,23 +2870,26 @@ with tab4:
     with col1:
         filtro_fruta = st.multiselect(
             "Filtrar por fruta",
-            options=casos_df["Fruta"].unique(),
+            options=sorted(catalogo["indice_fruta"]),
             default=None
         )
 
     with col2:
         filtro_aplicacion = st.multiselect(
             "Filtrar por aplicación",
-            options=casos_df["Aplicación"].unique(),
+            options=sorted(catalogo["indice_aplicacion"]),
             default=None
         )
 
-    # Aplicar filtros
-    df_filtrado = casos_df.copy()
+    # Aplicar filtros con los índices del catálogo
+    productos = set(catalogo["casos"])
     if filtro_fruta:
-        df_filtrado = df_filtrado[df_filtrado["Fruta"].isin(filtro_fruta)]
+        productos &= set().union(*(catalogo["indice_fruta"].get(fruta, ()) for fruta in filtro_fruta))
     if filtro_aplicacion:
-        df_filtrado = df_filtrado[df_filtrado["Aplicación"].isin(filtro_aplicacion)]
+        productos &= set().union(*(catalogo["indice_aplicacion"].get(aplicacion, ()) for aplicacion in filtro_aplicacion))
+    df_filtrado = casos_df[casos_df["Producto"].isin(productos)]
+
+    st.caption(f"Catálogo versión {catalogo['version']} · origen: {catalogo['origen']}")
 
     st.markdown("---")
 
@@ -918,12 +2909,55 @@ with tab4:
     # Selector de caso para cargar en calculadora
     st.subheader("🔬 Probar un Caso")
 
-    caso_seleccionado = st.selectbox(
-        "Selecciona un caso para analizar",
-        options=df_filtrado["Producto"].tolist()
-    )
+    col1, col2 = st.columns(2)
+
+    with col1:
+        caso_seleccionado = st.selectbox(
+            "Selecciona un caso para analizar",
+            options=df_filtrado["Producto"].tolist()
+        )
+
+    with col2:
+        masa_ejemplo = st.number_input(
+            "Masa de pulpa para el análisis (kg)",
+            min_value=0.1,
+            value=100.0,
+            step=10.0,
+            key="casos_masa"
+        )
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        analizar_caso = st.button("📊 Analizar Caso Seleccionado", type="primary", disabled=caso_seleccionado is None)
+
+    with col2:
+        analizar_todos = st.button("📊 Analizar Todos los Casos Filtrados", disabled=df_filtrado.empty)
+
+    if analizar_todos:
+        df_analisis_casos = analizar_casos(df_filtrado, masa_ejemplo)
+
+        st.markdown(f"### 📋 Comparación de {len(df_analisis_casos)} casos para {masa_ejemplo} kg de pulpa")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Azúcar Total", f"{df_analisis_casos['Azúcar Necesaria (kg)'].sum():.2f} kg")
+        with col2:
+            st.metric("Masa Final Total", f"{df_analisis_casos['Masa Final (kg)'].sum():.2f} kg")
+        with col3:
+            st.metric("Casos No Aplicables", f"{df_analisis_casos['Azúcar Necesaria (kg)'].isna().sum()}",
+                      help="Casos donde el °Brix objetivo no es mayor que el inicial")
+
+        mostrar_grafico(crear_grafico_casos(df_analisis_casos, masa_ejemplo))
+
+        st.dataframe(
+            df_analisis_casos[["Producto", "Fruta", "°Brix Inicial", "°Brix Objetivo",
+                               "Azúcar Necesaria (kg)", "Masa Final (kg)", "Proporción (%)"]].round(2),
+            use_container_width=True,
+            hide_index=True
+        )
 
-    if st.button("📊 Analizar Caso Seleccionado", type="primary"):
+    elif analizar_caso:
         caso = df_filtrado[df_filtrado["Producto"] == caso_seleccionado].iloc[0]
 
         st.markdown(f"### 📋 Análisis: {caso['Producto']}")
@@ -942,51 +2976,309 @@ with tab4:
         with col2:
             st.info(f"**Nota Técnica:**\n\n{caso['Notas']}")
 
-        # Realizar cálculo para masa ejemplo de 100 kg
-        masa_ejemplo = 100.0
-        azucar_necesaria, _ = calcular_azucar(
+        # Realizar cálculo para la masa indicada
+        resultado_caso = obtener_resultado_balance(
             masa_ejemplo,
             caso['°Brix Inicial'],
-            caso['°Brix Objetivo']
+            caso['°Brix Objetivo'],
+            clave="resultado_caso"
         )
+        azucar_necesaria = resultado_caso.cantidad_aditivo
 
-        st.markdown("---")
-        st.markdown(f"### 📊 Resultados para {masa_ejemplo} kg de pulpa")
+        if resultado_caso.error:
+            st.error(f"❌ {resultado_caso.error}")
+        else:
+            st.markdown("---")
+            st.markdown(f"### 📊 Resultados para {masa_ejemplo} kg de pulpa")
 
-        col1, col2, col3 = st.columns(3)
+            col1, col2, col3 = st.columns(3)
+
+            with col1:
+                st.metric("Azúcar Necesaria", f"{azucar_necesaria:.2f} kg")
+
+            with col2:
+                st.metric("Masa Final", f"{resultado_caso.masa_final:.2f} kg")
+
+            with col3:
+                st.metric("Proporción", f"{resultado_caso.proporcion_aditivo:.1f}%", help="% de azúcar respecto a la pulpa inicial")
+
+            # Gráficos
+            st.markdown("---")
+
+            col1, col2 = st.columns(2)
 
+            with col1:
+                fig_barras = crear_grafico_comparativo(resultado_caso)
+                mostrar_grafico(fig_barras)
+
+            with col2:
+                fig_circular = crear_grafico_circular(resultado_caso)
+                mostrar_grafico(fig_circular)
+
+# ===========================
+# TAB 5: COMPARACIÓN DE ESCENARIOS
+# ===========================
+
+with tab5:
+    st.header("🗺️ Comparación de Escenarios")
+    st.markdown("Evalúa el balance sobre todas las combinaciones de fruta, masa y °Brix objetivo a la vez")
+
+    frutas_escenarios = {fruta: info for fruta, info in obtener_frutas().items() if fruta != "Personalizado"}
+
+    frutas_barrido = st.multiselect(
+        "Frutas a comparar",
+        options=list(frutas_escenarios.keys()),
+        default=list(frutas_escenarios.keys())
+    )
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        masa_min = st.number_input("Masa mínima (kg)", min_value=0.1, value=10.0, step=10.0, key="escenarios_masa_min")
+        masa_max = st.number_input("Masa máxima (kg)", min_value=0.1, value=1000.0, step=10.0, key="escenarios_masa_max")
+
+    with col2:
+        objetivo_min = st.number_input("°Brix objetivo mínimo (%)", min_value=0.1, max_value=99.9, value=40.0, step=1.0, key="escenarios_obj_min")
+        objetivo_max = st.number_input("°Brix objetivo máximo (%)", min_value=0.1, max_value=99.9, value=70.0, step=1.0, key="escenarios_obj_max")
+
+    with col3:
+        n_masas = st.number_input("Puntos de masa", min_value=1, max_value=10000, value=100, step=10, key="escenarios_n_masas")
+        n_objetivos = st.number_input("Puntos de °Brix objetivo", min_value=1, max_value=10000, value=31, step=1, key="escenarios_n_obj")
+
+    if not frutas_barrido:
+        st.info("👆 Selecciona al menos una fruta para comparar")
+    elif masa_min > masa_max or objetivo_min > objetivo_max:
+        st.error("❌ Los valores mínimos deben ser menores o iguales a los máximos.")
+    elif len(frutas_barrido) * n_masas * n_objetivos > MAX_ESCENARIOS:
+        st.error(f"❌ La malla excede el máximo de {MAX_ESCENARIOS:,} escenarios. Reduce el número de puntos.")
+    else:
+        masas_barrido = np.linspace(masa_min, masa_max, int(n_masas))
+        objetivos_barrido = np.linspace(objetivo_min, objetivo_max, int(n_objetivos))
+        brix_barrido = tuple(frutas_escenarios[fruta]["brix_inicial"] for fruta in frutas_barrido)
+
+        resumen = resumir_escenarios(
+            tuple(frutas_barrido), brix_barrido,
+            masa_min, masa_max, int(n_masas),
+            objetivo_min, objetivo_max, int(n_objetivos)
+        )
+
+        col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Azúcar Necesaria", f"{azucar_necesaria:.2f} kg")
+            st.metric("Escenarios Evaluados", f"{resumen['evaluados']:,}")
+        with col2:
+            st.metric("Escenarios Factibles", f"{resumen['factibles']:,}")
+        with col3:
+            st.metric("Azúcar Máxima", f"{resumen['maxima']:.2f} kg" if resumen["maxima"] is not None else "—")
+
+        # Mapa de calor para una masa, submuestreando los objetivos si son demasiados
+        if len(masas_barrido) > 1:
+            idx_masa = st.select_slider(
+                "Masa para el mapa de calor",
+                options=range(len(masas_barrido)),
+                format_func=lambda i: f"{masas_barrido[i]:.2f} kg",
+                key="escenarios_idx_masa"
+            )
+        else:
+            idx_masa = 0
+        idx_obj = submuestrear_indices(len(objetivos_barrido), MAX_PUNTOS_MAPA)
+
+        # Solo se evalúa la rebanada de la masa elegida, no la malla completa
+        fig_mapa = crear_mapa_calor_escenarios(
+            frutas_barrido,
+            objetivos_barrido[idx_obj],
+            barrer_escenarios(brix_barrido, masas_barrido[[idx_masa]], objetivos_barrido[idx_obj])[:, 0, :],
+            masas_barrido[idx_masa]
+        )
+        mostrar_grafico(fig_mapa)
+
+        # Escenarios extremos, ordenados en el servidor sobre la malla completa
+        df_escenarios = resumen["extremos"]
+
+        if resumen["factibles"] > len(df_escenarios):
+            st.caption(f"Mostrando los {MAX_FILAS_TABLA // 2:,} escenarios factibles con más azúcar y los "
+                       f"{MAX_FILAS_TABLA // 2:,} con menos, de {resumen['factibles']:,} factibles")
+
+        st.dataframe(df_escenarios, use_container_width=True, hide_index=True)
+
+# ===========================
+# TAB 6: PROGRAMACIÓN DE TANQUES
+# ===========================
+
+with tab6:
+    st.header("🏭 Programación de Tanques")
+    st.markdown("Asigna lotes a tanques de mezcla y turnos según la capacidad y el azúcar disponible")
+
+    col1, col2, col3 = st.columns(3)
 
+    with col1:
+        capacidad_tanque = st.number_input("Capacidad por tanque (kg)", min_value=1.0, value=1000.0, step=50.0, key="tanques_capacidad")
+
+    with col2:
+        n_tanques = st.number_input("Número de tanques", min_value=1, max_value=100, value=3, step=1, key="tanques_numero")
+
+    with col3:
+        azucar_ilimitada = st.checkbox("Azúcar sin límite", value=False, key="tanques_azucar_ilimitada")
+        stock_azucar = st.number_input("Azúcar disponible (kg)", min_value=0.0, value=5000.0, step=100.0, key="tanques_azucar",
+                                       disabled=azucar_ilimitada)
+
+    archivo_lotes = st.file_uploader(
+        "Cargar lotes (CSV)",
+        type="csv",
+        help=f"Columnas requeridas: {', '.join(COLUMNAS_LOTES)}",
+        key="tanques_archivo"
+    )
+
+    if archivo_lotes is not None:
+        df_lotes, error_lotes = leer_lotes_csv(archivo_lotes)
+        if error_lotes:
+            st.error(f"❌ {error_lotes}")
+    else:
+        df_lotes = st.data_editor(
+            pd.DataFrame({
+                "Masa (kg)": [400.0, 250.0, 300.0, 150.0, 500.0],
+                "°Brix Inicial": [8.0, 12.0, 10.5, 14.0, 11.5],
+                "°Brix Objetivo": [65.0, 65.0, 40.0, 40.0, 14.0]
+            }),
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            key="tanques_lotes"
+        )
+
+    df_lotes = df_lotes[COLUMNAS_LOTES].dropna()
+
+    if st.button("🏭 Programar Tanques", type="primary", key="tanques_programar") and not df_lotes.empty:
+        lotes_programados, cargas_programadas = programar_tanques(
+            df_lotes["Masa (kg)"].to_numpy(),
+            df_lotes["°Brix Inicial"].to_numpy(),
+            df_lotes["°Brix Objetivo"].to_numpy(),
+            capacidad_tanque,
+            int(n_tanques),
+            np.inf if azucar_ilimitada else stock_azucar
+        )
+
+        en_programa = cargas_programadas["Tanque"] > 0
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Lotes Programados", f"{(lotes_programados['Estado'] == 'Programado').sum():,} / {len(lotes_programados):,}")
         with col2:
-            masa_final = masa_ejemplo + azucar_necesaria
-            st.metric("Masa Final", f"{masa_final:.2f} kg")
+            st.metric("Cargas", f"{int(en_programa.sum()):,}")
+        with col3:
+            st.metric("Turnos Necesarios", f"{int(cargas_programadas['Turno'].max()) if en_programa.any() else 0}")
+        with col4:
+            st.metric("Azúcar Utilizada", f"{cargas_programadas.loc[en_programa, 'Azúcar (kg)'].sum():.1f} kg")
+
+        if en_programa.any():
+            mostrar_grafico(crear_diagrama_gantt(cargas_programadas))
+
+        st.subheader("📋 Asignación por Lote")
+        st.dataframe(lotes_programados.round(3), use_container_width=True, hide_index=True)
 
+        with st.expander("Ver detalle por carga"):
+            st.dataframe(cargas_programadas.round(3), use_container_width=True, hide_index=True)
+
+# ===========================
+# TAB 7: ANÁLISIS DEL HISTORIAL
+# ===========================
+
+with tab7:
+    st.header("📈 Análisis del Historial")
+    st.markdown("Agregados de todos los cálculos de la sesión; los gráficos se reducen en el servidor antes de enviarse")
+
+    if not st.session_state.historial:
+        st.info("👈 Realiza cálculos en la Calculadora para ver su análisis")
+    else:
+        analisis = obtener_analisis_historial(st.session_state.historial)
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Cálculos", f"{analisis['calculos']:,}")
+        with col2:
+            st.metric("Azúcar Total", f"{analisis['azucar_total']:,.1f} kg")
         with col3:
-            proporcion = (azucar_necesaria / masa_ejemplo) * 100
-            st.metric("Proporción", f"{proporcion:.1f}%", help="% de azúcar respecto a la pulpa inicial")
+            st.metric("Pulpa Procesada", f"{analisis['pulpa_total']:,.1f} kg")
+        with col4:
+            st.metric("°Brix Objetivo Promedio", f"{analisis['brix_objetivo_promedio']:.1f}%")
 
-        # Gráficos
-        st.markdown("---")
+        # Azúcar por fruta y día
+        mostrar_grafico(crear_grafico_uso_diario(analisis["uso_diario"]))
 
         col1, col2 = st.columns(2)
 
         with col1:
-            fig_barras = crear_grafico_comparativo(
-                masa_ejemplo,
-                caso['°Brix Inicial'],
-                azucar_necesaria,
-                caso['°Brix Objetivo']
-            )
-            st.plotly_chart(fig_barras, use_container_width=True)
+            # Histogramas calculados en el servidor: solo se envían los conteos
+            mostrar_grafico(crear_grafico_distribucion_brix(BORDES_BRIX, analisis["conteo_inicial"], analisis["conteo_objetivo"]))
 
         with col2:
-            fig_circular = crear_grafico_circular(
-                masa_ejemplo,
-                caso['°Brix Inicial'],
-                azucar_necesaria
-            )
-            st.plotly_chart(fig_circular, use_container_width=True)
+            mostrar_grafico(crear_serie_azucar(analisis["fechas"], analisis["azucar_serie"], analisis["calculos"]))
+
+        st.subheader("📋 Resumen por Fruta")
+        st.dataframe(analisis["resumen_frutas"], use_container_width=True, hide_index=True)
+
+# ===========================
+# TAB 8: ARCHIVO HISTÓRICO
+# ===========================
+
+with tab8:
+    st.header("🗄️ Archivo Histórico de Lotes")
+    st.markdown(
+        "Compara el azúcar teórica del balance con el azúcar realmente usada en años de registros. "
+        f"El archivo es un directorio con las columnas {', '.join(f'`{nombre}.npy`' for nombre in COLUMNAS_ARCHIVO)}, "
+        "que se abren con memoria mapeada y se recorren por bloques."
+    )
+
+    nombre_archivo = st.text_input("Archivo", value="ejemplo", key="archivo_directorio",
+                                   help=f"Subdirectorio dentro de {DIRECTORIO_ARCHIVOS}")
+    directorio_archivo, error_directorio = resolver_directorio_archivo(nombre_archivo)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        reproducir = st.button("▶️ Abrir y Reproducir", type="primary", use_container_width=True)
+
+    with col2:
+        with st.popover("🧪 Generar archivo de ejemplo", use_container_width=True):
+            registros_ejemplo = st.number_input("Registros", min_value=1000, max_value=MAX_REGISTROS_EJEMPLO, value=1_000_000,
+                                                step=100_000, key="archivo_registros")
+            if st.button("Generar", key="archivo_generar"):
+                if error_directorio:
+                    st.error(f"❌ {error_directorio}")
+                else:
+                    generar_archivo_ejemplo(directorio_archivo, int(registros_ejemplo))
+                    st.success(f"✅ Archivo de {int(registros_ejemplo):,} registros guardado en {directorio_archivo}")
+
+    if reproducir:
+        if error_directorio:
+            estadisticas, error = None, error_directorio
+        else:
+            estadisticas, error = reproducir_archivo_cacheado(str(directorio_archivo), firma_archivo(directorio_archivo))
+
+        if error:
+            st.error(f"❌ {error}")
+        else:
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Registros", f"{estadisticas['registros']:,}", f"{estadisticas['validos']:,} con ajuste", delta_color="off")
+            with col2:
+                st.metric("Azúcar Teórica", f"{estadisticas['azucar_teorica']:,.0f} kg")
+            with col3:
+                diferencia = estadisticas["azucar_real"] - estadisticas["azucar_teorica"]
+                st.metric("Azúcar Real", f"{estadisticas['azucar_real']:,.0f} kg", f"{diferencia:+,.0f} kg", delta_color="inverse")
+            with col4:
+                st.metric("Lotes con Sobreuso", f"{estadisticas['porcentaje_sobreuso']:.1f}%")
+
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Discrepancia Media", f"{estadisticas['discrepancia_media']:+.3f} kg/lote")
+            with col2:
+                st.metric("Desviación Estándar", f"{estadisticas['discrepancia_desviacion']:.3f} kg")
+            with col3:
+                st.metric("Desviación Mediana", f"{percentil_histograma(estadisticas['histograma'], BORDES_DISCREPANCIA, 50):+.1f}%")
+            with col4:
+                st.metric("Desviación p95", f"{percentil_histograma(estadisticas['histograma'], BORDES_DISCREPANCIA, 95):+.1f}%")
+
+            mostrar_grafico(crear_grafico_discrepancias(estadisticas["histograma"], BORDES_DISCREPANCIA))
 
 # ===========================
 # HISTORIAL (SIDEBAR AL FINAL)
@@ -1000,15 +3292,16 @@ with st.sidebar:
         st.caption(f"Total de cálculos: {len(st.session_state.historial)}")
 
         # Mostrar últimos 5 cálculos
-        for i, calc in enumerate(reversed(st.session_state.historial[-5:])):
+        for i, registro in enumerate(reversed(st.session_state.historial[-5:])):
+            calc = dict(zip(HISTORIAL_COLUMNAS, registro))
             with st.expander(f"{calc['Fruta']} - {calc['Fecha']}", expanded=False):
                 st.text(f"Masa: {calc['Masa Pulpa (kg)']} kg")
                 st.text(f"°Brix: {calc['°Brix Inicial']}% → {calc['°Brix Objetivo']}%")
-                st.text(f"Azúcar: {calc['Azúcar a Agregar (kg)']} kg")
+                st.text(f"{calc['Aditivo']}: {calc['Aditivo a Agregar (kg)']} kg")
 
         if len(st.session_state.historial) > 0:
             # Exportar historial
-            df_historial = pd.DataFrame(st.session_state.historial)
+            df_historial = pd.DataFrame(st.session_state.historial, columns=HISTORIAL_COLUMNAS)
             csv = df_historial.to_csv(index=False).encode('utf-8')
 
             st.download_button(
@@ -1025,6 +3318,58 @@ with st.sidebar:
     else:
         st.caption("No hay cálculos en el historial")
 
+    # Inspector de memoria de sesión
+    st.markdown("---")
+    with st.expander("🧠 Memoria de Sesión"):
+        if st.toggle("Inspeccionar memoria", key="inspeccionar_memoria",
+                     help="Mide el tamaño de cada clave del session state (tiene un costo en cada recarga)"):
+            df_memoria = inspeccionar_sesion(st.session_state)
+            st.caption(f"Esta sesión: {df_memoria['Bytes'].sum() / 1024:.1f} KB en {len(df_memoria)} claves")
+            st.dataframe(df_memoria, use_container_width=True, hide_index=True)
+
+            # Mide el estado de las demás sesiones del servidor que no están ejecutando
+            # su script; las ocupadas conservan su última medición
+            registro_sesiones = obtener_registro_sesiones()["sesiones"]
+            sesiones_servidor = listar_sesiones_servidor()
+            ctx = get_script_run_ctx()
+            for session_id, info in list(registro_sesiones.items()):
+                if ctx is not None and session_id == ctx.session_id:
+                    info["bytes"] = int(df_memoria["Bytes"].sum())
+                elif session_id in sesiones_servidor:
+                    bytes_sesion = medir_sesion_ajena(sesiones_servidor[session_id])
+                    if bytes_sesion is not None:
+                        info["bytes"] = bytes_sesion
+
+            ahora = time.time()
+            st.caption(f"Sesiones activas: {len(registro_sesiones)}")
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "Sesión": session_id[:8],
+                        "Claves": info["claves"],
+                        "KB": round(info["bytes"] / 1024, 1) if info["bytes"] is not None else None,
+                        "Inactiva (s)": round(ahora - info["ultimo_acceso"]),
+                        "Compactada": info["compactada"]
+                    }
+                    for session_id, info in list(registro_sesiones.items())
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
+
+        if st.button("🗜️ Compactar Sesión", use_container_width=True):
+            compactar_sesion(st.session_state)
+            st.rerun()
+
+    # Reporte de tamaño de gráficos
+    if reporte_graficos:
+        with st.expander("📦 Tamaño de Gráficos"):
+            df_payload = pd.DataFrame(reporte_graficos)
+            original = df_payload["Original (KB)"].sum()
+            liviano = df_payload["Liviano (KB)"].sum()
+            st.caption(f"Total: {original:.1f} KB → {liviano:.1f} KB ({(1 - liviano / original) * 100:.0f}% menos)")
+            st.dataframe(df_payload, use_container_width=True, hide_index=True)
+
 # Footer
 st.markdown("---")
 st.markdown("""
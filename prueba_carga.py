@@ -0,0 +1,231 @@
+"""
+Prueba de carga del Sistema de Balance de Materia.
+
+Levanta la aplicación con `streamlit run` en modo headless y conecta varias
+sesiones concurrentes por websocket, como lo haría el navegador de cada operador.
+Cada sesión repite las acciones principales de la aplicación ("Calcular Balance",
+"Generar Nuevo Ejercicio" y "Analizar Caso Seleccionado"). Reporta throughput,
+percentiles de latencia y crecimiento de memoria del servidor para cada nivel de
+concurrencia.
+
+Todas las sesiones corren como hilos dentro de un solo proceso servidor, igual que
+en producción, por lo que comparten el GIL y los recursos de `st.cache_resource`.
+La memoria por sesión se estima como el crecimiento del RSS del servidor respecto
+a la línea base (servidor ya calentado con una sesión) dividido entre las sesiones.
+
+Los ejercicios generados durante la prueba se registran en una base de intentos
+temporal, no en la base real de los estudiantes.
+
+Uso:
+    python prueba_carga.py --sesiones 1 5 10 20 --iteraciones 10
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+RUTA_APP = str(Path(__file__).with_name("app.py"))
+
+ACCIONES = [
+    "🔬 Calcular Balance",
+    "🎲 Generar Nuevo Ejercicio",
+    "📊 Analizar Caso Seleccionado"
+]
+
+def puerto_libre():
+    """Retorna un puerto TCP libre en localhost"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def iniciar_servidor(puerto, timeout, base_intentos):
+    """Inicia `streamlit run` en modo headless y espera a que responda el health check"""
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", RUTA_APP,
+         "--server.headless", "true",
+         "--server.port", str(puerto),
+         "--browser.gatherUsageStats", "false"],
+        env={**os.environ, "BALANCE_BASE_INTENTOS": base_intentos},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if servidor.poll() is not None:
+            raise RuntimeError("El servidor de Streamlit terminó durante el arranque")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{puerto}/_stcore/health", timeout=1) as respuesta:
+                if respuesta.status == 200:
+                    return servidor
+        except OSError:
+            time.sleep(0.2)
+
+    servidor.terminate()
+    raise RuntimeError("El servidor de Streamlit no respondió a tiempo")
+
+def medir_rss(pid):
+    """Retorna el RSS actual (bytes) del proceso, leído de /proc (solo Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+class SesionSimulada:
+    """Cliente websocket mínimo que reproduce lo que el navegador envía al servidor"""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.botones = {}
+        self.conexion = None
+
+    async def conectar(self):
+        self.conexion = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def cerrar(self):
+        await self.conexion.close()
+
+    async def ejecutar(self, boton=None):
+        """Solicita un rerun (opcionalmente pulsando un botón) y espera a que termine el script"""
+        mensaje = BackMsg()
+        mensaje.rerun_script.query_string = ""
+        mensaje.rerun_script.page_script_hash = ""
+        if boton is not None:
+            widget = mensaje.rerun_script.widget_states.widgets.add()
+            widget.id = self.botones[boton]
+            widget.trigger_value = True
+
+        inicio = time.perf_counter()
+        await self.conexion.send(mensaje.SerializeToString())
+
+        while True:
+            respuesta = ForwardMsg()
+            respuesta.ParseFromString(await asyncio.wait_for(self.conexion.recv(), self.timeout))
+            tipo = respuesta.WhichOneof("type")
+
+            if tipo == "delta" and respuesta.delta.WhichOneof("type") == "new_element":
+                elemento = respuesta.delta.new_element
+                tipo_elemento = elemento.WhichOneof("type")
+                if tipo_elemento == "button":
+                    self.botones[elemento.button.label] = elemento.button.id
+                elif tipo_elemento == "exception":
+                    raise RuntimeError(f"Excepción en '{boton}': {elemento.exception.message}")
+            elif tipo == "script_finished":
+                return time.perf_counter() - inicio
+
+async def simular_sesion(url, iteraciones, timeout, sincronizacion):
+    """Ejecuta una sesión completa y retorna las latencias (s) de cada acción"""
+    sesion = SesionSimulada(url, timeout)
+    await sesion.conectar()
+    try:
+        latencias = [("Carga inicial", await sesion.ejecutar())]
+
+        for _ in range(iteraciones):
+            for accion in ACCIONES:
+                if accion not in sesion.botones:
+                    raise LookupError(f"No se encontró el botón '{accion}'")
+                latencias.append((accion, await sesion.ejecutar(accion)))
+
+        # La sesión sigue abierta hasta que terminan todas, para medir la memoria con
+        # todas las sesiones vivas a la vez
+        sincronizacion["pendientes"] -= 1
+        if sincronizacion["pendientes"] == 0:
+            sincronizacion["terminadas"].set()
+        await sincronizacion["terminadas"].wait()
+        return latencias
+    finally:
+        await sesion.cerrar()
+
+async def muestrear_rss(pid, muestras):
+    """Registra el RSS del servidor cada 100 ms hasta ser cancelada"""
+    while True:
+        rss = medir_rss(pid)
+        if rss is not None:
+            muestras.append(rss)
+        await asyncio.sleep(0.1)
+
+async def ejecutar_nivel(url, pid, sesiones, iteraciones, timeout):
+    """Ejecuta `sesiones` sesiones concurrentes contra el servidor y resume sus métricas"""
+    rss_base = medir_rss(pid)
+    muestras = []
+    muestreo = asyncio.create_task(muestrear_rss(pid, muestras))
+    sincronizacion = {"pendientes": sesiones, "terminadas": asyncio.Event()}
+
+    inicio = time.perf_counter()
+    try:
+        resultados = await asyncio.gather(*[
+            simular_sesion(url, iteraciones, timeout, sincronizacion) for _ in range(sesiones)
+        ])
+    finally:
+        muestreo.cancel()
+    duracion = time.perf_counter() - inicio
+
+    latencias = np.array([latencia for registro in resultados for _, latencia in registro])
+    crecimiento = (max(muestras) - rss_base) / sesiones if muestras and rss_base else np.nan
+
+    return {
+        "Sesiones": sesiones,
+        "Reruns": len(latencias),
+        "Duración (s)": round(duracion, 2),
+        "Throughput (reruns/s)": round(len(latencias) / duracion, 2),
+        "Latencia p50 (ms)": round(np.percentile(latencias, 50) * 1000, 1),
+        "Latencia p95 (ms)": round(np.percentile(latencias, 95) * 1000, 1),
+        "Latencia p99 (ms)": round(np.percentile(latencias, 99) * 1000, 1),
+        "RSS servidor (MB)": round(max(muestras, default=np.nan) / 1024 ** 2, 1),
+        "Δ RSS por sesión (MB)": round(crecimiento / 1024 ** 2, 2)
+    }
+
+async def ejecutar_prueba(url, pid, niveles, iteraciones, timeout):
+    """Calienta el servidor con una sesión y luego recorre los niveles de concurrencia"""
+    await ejecutar_nivel(url, pid, 1, 1, timeout)
+    return [await ejecutar_nivel(url, pid, sesiones, iteraciones, timeout) for sesiones in niveles]
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones concurrentes simuladas")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[1, 5, 10, 20],
+                        help="Niveles de concurrencia a evaluar")
+    parser.add_argument("--iteraciones", type=int, default=5,
+                        help="Repeticiones de la secuencia de acciones por sesión")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Tiempo máximo por rerun y para el arranque del servidor (s)")
+    parser.add_argument("--csv", help="Ruta opcional para guardar el reporte en CSV")
+    args = parser.parse_args()
+
+    puerto = puerto_libre()
+    with tempfile.TemporaryDirectory() as directorio:
+        servidor = iniciar_servidor(puerto, args.timeout, os.path.join(directorio, "intentos_prueba.db"))
+        try:
+            niveles = asyncio.run(ejecutar_prueba(
+                f"ws://127.0.0.1:{puerto}/_stcore/stream", servidor.pid,
+                args.sesiones, args.iteraciones, args.timeout
+            ))
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+    reporte = pd.DataFrame(niveles)
+
+    print(reporte.to_string(index=False))
+
+    if args.csv:
+        reporte.to_csv(args.csv, index=False)
+
+if __name__ == "__main__":
+    main()